@@ -6,6 +6,7 @@ from francesubdivisions.services.django_admin import (
     related_object_link,
     view_reverse_changelink,
 )
+from francesubdivisions.services.utils import normalize_name
 
 # Inlines
 class RegionDataInline(admin.TabularInline):
@@ -29,9 +30,29 @@ class CommuneDataInline(admin.TabularInline):
 
 
 # Templates
+class CollectivityModelAdmin(TimeStampModelAdmin):
+    """
+    Meta admin for the collectivities, searched on their normalized name
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        # The search_name lookups only match a normalized search term
+        normalized_term = normalize_name(search_term)
+        if normalized_term != search_term:
+            normalized_results, normalized_duplicates = super().get_search_results(
+                request, queryset, normalized_term
+            )
+            results |= normalized_results
+            may_have_duplicates |= normalized_duplicates
+        return results, may_have_duplicates
+
+
 @admin.register(models.Region)
-class RegionAdmin(TimeStampModelAdmin):
-    search_fields = ("name__startswith", "slug", "insee", "siren")
+class RegionAdmin(CollectivityModelAdmin):
+    search_fields = ("search_name__contains", "slug", "insee", "siren")
     list_display = ("name", "slug", "insee", "siren", "view_departements_link")
     ordering = ["name"]
     inlines = [RegionDataInline]
@@ -71,8 +92,8 @@ class RegionAdmin(TimeStampModelAdmin):
 
 
 @admin.register(models.Departement)
-class DepartementAdmin(TimeStampModelAdmin):
-    search_fields = ("name__startswith", "slug", "insee", "siren")
+class DepartementAdmin(CollectivityModelAdmin):
+    search_fields = ("search_name__contains", "slug", "insee", "siren")
     list_display = ("name", "slug", "insee", "siren", "view_communes_link")
     list_filter = ("years", "region")
     ordering = ["name"]
@@ -120,8 +141,8 @@ class DepartementAdmin(TimeStampModelAdmin):
 
 
 @admin.register(models.Epci)
-class EpciAdmin(TimeStampModelAdmin):
-    search_fields = ("name", "slug", "siren")
+class EpciAdmin(CollectivityModelAdmin):
+    search_fields = ("search_name__contains", "slug", "siren")
     list_display = ("name", "slug", "siren", "view_communes_link")
     ordering = ["name"]
     inlines = [EpciDataInline]
@@ -152,8 +173,8 @@ class EpciAdmin(TimeStampModelAdmin):
 
 
 @admin.register(models.Commune)
-class CommuneAdmin(TimeStampModelAdmin):
-    search_fields = ("name", "slug", "insee", "siren")
+class CommuneAdmin(CollectivityModelAdmin):
+    search_fields = ("search_name__contains", "slug", "insee", "siren")
     list_display = ("name", "slug", "insee", "siren")
     list_filter = ("years", "departement", "epci")
     ordering = ["name", "insee"]
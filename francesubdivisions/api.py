@@ -1,12 +1,13 @@
-from ninja import Router, Schema
-from unidecode import unidecode
+from ninja import Query, Router, Schema
+from ninja.errors import HttpError
+from ninja.pagination import paginate
 from typing import List
+from django.db.models import Q
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-
-from django.db.models import Max
+from django.views.decorators.http import condition
 
 from francesubdivisions.models import (
-    Metadata,
     Region,
     Departement,
     Epci,
@@ -14,213 +15,283 @@ from francesubdivisions.models import (
     DataYear,
 )
 
+from francesubdivisions.services.data import (
+    DATA_LEVELS,
+    get_data_matrix,
+    split_values,
+)
+from francesubdivisions.services.data_version import (
+    data_version_etag,
+    data_version_last_modified,
+)
+from francesubdivisions.services.export import export_response
+from francesubdivisions.services.fields import select_fields
+from francesubdivisions.services.hierarchy import (
+    get_hierarchy_content,
+    hierarchy_response,
+)
+from francesubdivisions.services.pagination import KeysetPagination
+from francesubdivisions.services.response_cache import cache_response
+from francesubdivisions.services.search import (
+    SEARCH_PER_GROUP_LIMIT,
+    build_search_response,
+    get_search_levels,
+    search_level,
+)
+from francesubdivisions.services.utils import normalize_name
+from francesubdivisions.services.years import get_current_year
 from francesubdivisions.schemas import (
     DataYearSchema,
     RegionSchema,
     DepartementSchema,
     EpciSchema,
     CommuneSchema,
+    RegionListSchema,
+    DepartementListSchema,
+    CommuneListSchema,
+    ListFiltersSchema,
+    ResolveSchema,
+    DepartementResolveSchema,
+    EpciResolveSchema,
+    CommuneResolveSchema,
+    DataSchema,
 )
 
 router = Router()
 
+# The responses only change with the data, so they are cached for its version,
+# and validated with it before running the operation (the last decorator runs first)
+router.add_decorator(cache_response, mode="view")
+router.add_decorator(
+    condition(
+        etag_func=data_version_etag, last_modified_func=data_version_last_modified
+    ),
+    mode="view",
+)
 
-@router.get("/subdivisions/{query}", tags=["subdivisions"])
-def search_subdivisions(request, query: str, category: str = None, year: int = None):
+# The querysets load the years of the entries in a fixed number of queries,
+# the nested regions, départements and EPCIs are read from their Fragments
+REGIONS = Region.objects.prefetch_related("years")
+DEPARTEMENTS = Departement.objects.prefetch_related("years")
+EPCIS = Epci.objects.prefetch_related("years")
+COMMUNES = Commune.objects.prefetch_related("years")
+
+
+def get_list_queryset(queryset, level: str, filters: ListFiltersSchema):
+    try:
+        return select_fields(queryset, level, filters.fields, filters.flat)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+
+def resolve_codes(queryset, codes: list, code_fields: dict) -> dict:
     """
-    Search within all categories
+    Retrieves the entries matching a list of codes in one query,
+    and lists the codes that match no entry
 
-    Allowed values for category parameter : all, communes, epcis, departements, regions
+    code_fields: the field compared to the codes of each length
     """
-    query = unidecode(query).lower()
+    filters = Q(pk__in=[])
+    for length, field in code_fields.items():
+        filters |= Q(
+            **{f"{field}__in": {code for code in codes if len(code) == length}}
+        )
+    items = list(queryset.filter(filters))
+
+    found = {getattr(item, field) for item in items for field in code_fields.values()}
+    missing = [code for code in dict.fromkeys(codes) if code not in found]
+    return {"items": items, "missing": missing}
 
-    # Check type optional parameter:
-    if category in ["communes", "epcis", "departements", "regions"]:
-        return_all_categories = False
-    else:
-        # If any other value is specified, we'll treat it the same as "all"
-        return_all_categories = True
 
-    # Initiate the lists
-    communes_raw = []
-    epcis_raw = []
-    departements_raw = []
-    regions_raw = []
-    response = []
+def get_year_entry(level: str, year: int = None) -> DataYear:
+    """
+    Returns the DataYear of year, by default the current one of the level
+    """
+    try:
+        if year:
+            return DataYear.objects.get(year=year)
+        return get_current_year(level)
+    except DataYear.DoesNotExist:
+        raise HttpError(404, year_not_found_message(level, year))
+
+
+def year_not_found_message(level: str, year: int = None) -> str:
+    if year:
+        return f"No data for the year {year}"
+    return f"No year imported for {level}"
+
+
+def get_search_results(
+    query: str,
+    category: str = None,
+    year: int = None,
+    limit: int = None,
+    per_group_limit: int = SEARCH_PER_GROUP_LIMIT,
+) -> list:
+    query = normalize_name(query)
+    levels = get_search_levels(category)
+    if limit:
+        per_group_limit = min(per_group_limit, limit)
 
     # year filter
-    if not year:
-        if category == "regions" or return_all_categories:
-            regions_year_entry = DataYear.objects.get(
-                year=Metadata.objects.filter(prop="cog_regions_year").aggregate(
-                    Max("value")
-                )["value__max"]
-            )
-
-        if category == "departements" or return_all_categories:
-            departements_year_entry = DataYear.objects.get(
-                year=Metadata.objects.filter(prop="cog_depts_year").aggregate(
-                    Max("value")
-                )["value__max"]
-            )
-
-        if category == "epcis" or return_all_categories:
-            epcis_year_entry = DataYear.objects.get(
-                year=Metadata.objects.filter(prop="banatic_epci_year").aggregate(
-                    Max("value")
-                )["value__max"]
-            )
-
-        if category == "communes" or return_all_categories:
-            communes_year_entry = DataYear.objects.get(
-                year=Metadata.objects.filter(prop="cog_communes_year").aggregate(
-                    Max("value")
-                )["value__max"]
-            )
-    else:
-        regions_year_entry = DataYear.objects.get(year=year)
-        departements_year_entry = regions_year_entry
-        epcis_year_entry = regions_year_entry
-        communes_year_entry = regions_year_entry
-
-    if len(query) < 3 and (category == "communes" or return_all_categories):
-        shortnamed_communes = [
-            "by",
-            "bu",
-            "eu",
-            "gy",
-            "oz",
-            "oo",
-            "py",
-            "ri",
-            "ry",
-            "sy",
-            "ur",
-            "us",
-            "uz",
-            "y",
-        ]
-        if query in shortnamed_communes:
-            communes_raw = Commune.objects.filter(
-                name__unaccent__iexact=query, years__exact=communes_year_entry
-            )
+    if year:
+        year_entries = dict.fromkeys(levels, get_year_entry(levels[0], year))
     else:
-        if category == "regions" or return_all_categories:
-            regions_raw = Region.objects.filter(
-                name__unaccent__istartswith=query, years__exact=regions_year_entry
-            ).exclude(
-                siren__exact=""
-            )  # Exclude Mayotte that has no region-level Siren
-        if category == "departements" or return_all_categories:
-            departements_raw = Departement.objects.filter(
-                name__unaccent__istartswith=query, years__exact=departements_year_entry
-            ).exclude(
-                siren__exact=""
-            )  # Exclude Haute-Corse, Corse-du-Sud, Martinique and Guyane that have no departement-level Siren
-        if category == "epcis" or return_all_categories:
-            epcis_raw = Epci.objects.filter(
-                name__unaccent__icontains=query, years__exact=epcis_year_entry
-            )
-        if category == "communes" or return_all_categories:
-            communes_raw = Commune.objects.filter(
-                name__unaccent__istartswith=query, years__exact=communes_year_entry
-            )
-
-    if len(regions_raw):
-        regions = []
-        for r in regions_raw:
-            regions.append(
-                {"value": r.siren, "text": r.name, "type": "region", "slug": r.slug}
-            )
-
-        response.append({"groupName": "Régions", "items": regions})
-
-    if len(departements_raw):
-        departements = []
-        for d in departements_raw:
-            departements.append(
-                {
-                    "value": d.siren,
-                    "text": d.name,
-                    "type": "departement",
-                    "slug": d.slug,
-                }
-            )
-
-        response.append({"groupName": "Départements", "items": departements})
-
-    if len(epcis_raw):
-        epcis = []
-        for e in epcis_raw:
-            epcis.append(
-                {"value": e.siren, "text": e.name, "type": "epci", "slug": e.slug}
-            )
-
-        response.append({"groupName": "Intercommunalités", "items": epcis})
-
-    if len(communes_raw):
-        communes = []
-        for c in communes_raw:
-            communes.append(
-                {
-                    "value": c.siren,
-                    "text": f"{c.name} ({c.insee})",
-                    "name": c.name,
-                    "insee": c.insee,
-                    "type": "commune",
-                    "slug": c.slug,
-                }
-            )
-
-        response.append({"groupName": "Communes", "items": communes})
-
-    return response
-
-
-@router.get("/regions", response=List[RegionSchema], tags=["subdivisions"])
-def list_regions(request):
-    queryset = Region.objects.all()
+        year_entries = {level: get_year_entry(level) for level in levels}
+
+    results = {
+        level: search_level(level, query, year_entries[level], per_group_limit)
+        for level in levels
+    }
+    return build_search_response(results, limit)
+
+
+def get_hierarchy_response(request, year: int = None) -> HttpResponse:
+    year_entry = get_year_entry("communes", year)
+    content, compressed, etag = get_hierarchy_content(year_entry)
+    return hierarchy_response(request, content, compressed, etag)
+
+
+def get_data_values(level: str, codes: str, datacodes: str, years: str) -> dict:
+    """
+    Returns the matrix of a data request, given its comma-separated parameters
+    """
+    if level not in DATA_LEVELS:
+        raise HttpError(404, f"No data for {level}")
+    try:
+        years = [int(year) for year in split_values(years or "")]
+    except ValueError:
+        raise HttpError(400, "The years must be integers")
+    if not years:
+        years = [get_year_entry(level).year]
+
+    try:
+        return get_data_matrix(
+            level, split_values(codes), split_values(datacodes), years
+        )
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+
+@router.get("/subdivisions/{query}", tags=["subdivisions"])
+def search_subdivisions(
+    request,
+    query: str,
+    category: str = None,
+    year: int = None,
+    limit: int = Query(None, ge=1),
+    per_group_limit: int = Query(SEARCH_PER_GROUP_LIMIT, ge=1),
+):
+    """
+    Search within all categories
+
+    Allowed values for category parameter : all, communes, epcis, departements, regions
+
+    The results are ordered by relevance (exact match, then prefix, then word prefix,
+    then population), with at most per_group_limit results in each category
+    and limit results in total.
+    """
+    return get_search_results(query, category, year, limit, per_group_limit)
+
+
+@router.get(
+    "/regions",
+    response=List[RegionListSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(KeysetPagination)
+def list_regions(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(REGIONS, "regions", filters)
     return queryset
 
 
 @router.get("/regions/{siren_id}", response=RegionSchema, tags=["subdivisions"])
 def get_region(request, siren_id):
-    item = get_object_or_404(Region, siren=siren_id)
+    item = get_object_or_404(REGIONS, siren=siren_id)
     return item
 
 
-@router.get("/departements", response=List[DepartementSchema], tags=["subdivisions"])
-def list_departements(request):
-    queryset = Departement.objects.all()
+@router.get(
+    "/departements",
+    response=List[DepartementListSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(KeysetPagination)
+def list_departements(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(DEPARTEMENTS, "departements", filters)
     return queryset
 
 
+@router.post(
+    "/departements/resolve", response=DepartementResolveSchema, tags=["subdivisions"]
+)
+def resolve_departements(request, payload: ResolveSchema):
+    """
+    Retrieves the départements of a list of Insee (2 or 3 characters)
+    or Siren (9 characters) ids
+    """
+    return resolve_codes(
+        DEPARTEMENTS, payload.codes, {2: "insee", 3: "insee", 9: "siren"}
+    )
+
+
 @router.get(
     "/departements/{siren_id}", response=DepartementSchema, tags=["subdivisions"]
 )
 def get_departement(request, siren_id):
-    item = get_object_or_404(Departement, siren=siren_id)
+    item = get_object_or_404(DEPARTEMENTS, siren=siren_id)
     return item
 
 
-@router.get("/epcis", response=List[EpciSchema], tags=["subdivisions"])
-def list_epcis(request):
-    queryset = Epci.objects.all()
+@router.get(
+    "/epcis",
+    response=List[EpciSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(KeysetPagination)
+def list_epcis(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(EPCIS, "epcis", filters)
     return queryset
 
 
+@router.post("/epcis/resolve", response=EpciResolveSchema, tags=["subdivisions"])
+def resolve_epcis(request, payload: ResolveSchema):
+    """
+    Retrieves the EPCIs of a list of Siren ids
+    """
+    return resolve_codes(EPCIS, payload.codes, {9: "siren"})
+
+
 @router.get("/epcis/{siren_id}", response=EpciSchema, tags=["subdivisions"])
 def get_epci(request, siren_id):
-    item = get_object_or_404(Epci, siren=siren_id)
+    item = get_object_or_404(EPCIS, siren=siren_id)
     return item
 
 
-@router.get("/communes", response=List[CommuneSchema], tags=["subdivisions"])
-def list_communes(request):
-    queryset = Epci.objects.all()
+@router.get(
+    "/communes",
+    response=List[CommuneListSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(KeysetPagination)
+def list_communes(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(COMMUNES, "communes", filters)
     return queryset
 
 
+@router.post("/communes/resolve", response=CommuneResolveSchema, tags=["subdivisions"])
+def resolve_communes(request, payload: ResolveSchema):
+    """
+    Depending if each code is 5 or 9 characters long, retrieves the communes
+    by Insee or Siren id.
+    """
+    return resolve_codes(COMMUNES, payload.codes, {5: "insee", 9: "siren"})
+
+
 @router.get(
     "/communes/{commune_id}",
     response={200: CommuneSchema, 404: dict},
@@ -231,9 +302,9 @@ def get_commune(request, commune_id):
     Depending if commune_id is 5 or 9 characters long, retrieves the commune by Insee or Siren id.
     """
     if len(commune_id) == 9:
-        item = get_object_or_404(Commune, siren=commune_id)
+        item = get_object_or_404(COMMUNES, siren=commune_id)
     elif len(commune_id) == 5:
-        item = get_object_or_404(Commune, insee=commune_id)
+        item = get_object_or_404(COMMUNES, insee=commune_id)
     else:
         return 404, {"message": "value is not a siren or insee id"}
     return 200, item
@@ -241,11 +312,48 @@ def get_commune(request, commune_id):
 
 @router.get("/communes/siren/{siren_id}", response=CommuneSchema, tags=["subdivisions"])
 def get_commune_by_siren(request, siren_id):
-    item = get_object_or_404(Commune, siren=siren_id)
+    item = get_object_or_404(COMMUNES, siren=siren_id)
     return item
 
 
 @router.get("/communes/insee/{insee_id}", response=CommuneSchema, tags=["subdivisions"])
 def get_commune_by_insee(request, insee_id):
-    item = get_object_or_404(Commune, insee=insee_id)
+    item = get_object_or_404(COMMUNES, insee=insee_id)
     return item
+
+
+@router.get("/hierarchy", tags=["subdivisions"])
+def get_hierarchy(request, year: int = None):
+    """
+    Returns the whole tree of the regions, départements, EPCIs and communes of a year
+    (the current one by default) in one document, compressed if the client accepts it
+    """
+    return get_hierarchy_response(request, year)
+
+
+@router.get("/data/{level}", response=DataSchema, tags=["data"])
+def get_data(request, level: str, codes: str, datacodes: str, years: str = None):
+    """
+    Returns the values of the datacodes for many collectivities and years at once
+
+    Allowed values for level : communes, epcis, departements, regions
+
+    codes, datacodes, years: comma-separated lists, the codes being Insee or Siren ids
+    years: by default, the current year of the level
+    """
+    return get_data_values(level, codes, datacodes, years)
+
+
+@router.get("/export/{level}.{export_format}", tags=["export"])
+def export_subdivisions(
+    request, level: str, export_format: str, year: int = None, departement: str = None
+):
+    """
+    Streams all the entries of a level, as NDJSON or CSV
+
+    Allowed values for level : communes, epcis, departements, regions
+    Allowed values for export_format : ndjson, csv
+
+    The entries can be filtered by year and by the Insee code of their département.
+    """
+    return export_response(level, export_format, year, departement)
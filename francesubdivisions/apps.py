@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FrancesubdivisionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "francesubdivisions"
+
+    def ready(self):
+        from francesubdivisions import signals  # noqa: F401
@@ -0,0 +1,205 @@
+"""
+Async versions of the search, list and detail endpoints, for the ASGI deployments.
+
+The router has the same paths as the one of api.py, and is mounted instead of it.
+The views attach the Fragments nested in their responses to the entries beforehand,
+since the schemas can't query the database from the event loop.
+"""
+
+from asgiref.sync import sync_to_async
+from ninja import Query, Router
+from ninja.pagination import paginate
+from typing import List
+from django.shortcuts import aget_object_or_404
+
+from francesubdivisions import api
+from francesubdivisions.api import (
+    COMMUNES,
+    DEPARTEMENTS,
+    EPCIS,
+    REGIONS,
+    get_data_values,
+    get_hierarchy_response,
+    get_list_queryset,
+    get_search_results,
+)
+from francesubdivisions.schemas import (
+    RegionSchema,
+    DepartementSchema,
+    EpciSchema,
+    CommuneSchema,
+    RegionListSchema,
+    DepartementListSchema,
+    CommuneListSchema,
+    DataSchema,
+    ListFiltersSchema,
+)
+from francesubdivisions.services.export import export_response
+from francesubdivisions.services.fragments import aattach_fragments
+from francesubdivisions.services.pagination import KeysetPagination
+from francesubdivisions.services.response_cache import acache_response
+from francesubdivisions.services.search import SEARCH_PER_GROUP_LIMIT
+
+
+class FragmentsPagination(KeysetPagination):
+    """
+    Attaches the nested Fragments to the entries of the page
+    """
+
+    async def apaginate_queryset(self, queryset, pagination, request, **params):
+        page = await super().apaginate_queryset(queryset, pagination, request, **params)
+        await aattach_fragments(page["items"])
+        return page
+
+
+def documented_as(sync_view):
+    """
+    Gives the docstring of the sync view, its OpenAPI description, to the async one
+    """
+
+    def decorator(view):
+        view.__doc__ = sync_view.__doc__
+        return view
+
+    return decorator
+
+
+router = Router()
+
+router.add_decorator(acache_response, mode="view")
+
+
+@router.get("/subdivisions/{query}", tags=["subdivisions"])
+@documented_as(api.search_subdivisions)
+async def search_subdivisions(
+    request,
+    query: str,
+    category: str = None,
+    year: int = None,
+    limit: int = Query(None, ge=1),
+    per_group_limit: int = Query(SEARCH_PER_GROUP_LIMIT, ge=1),
+):
+    # The search reads the database (or builds its index from it) in a thread
+    return await sync_to_async(get_search_results)(
+        query, category, year, limit, per_group_limit
+    )
+
+
+@router.get(
+    "/regions",
+    response=List[RegionListSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(FragmentsPagination)
+async def list_regions(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(REGIONS, "regions", filters)
+    return queryset
+
+
+@router.get("/regions/{siren_id}", response=RegionSchema, tags=["subdivisions"])
+async def get_region(request, siren_id):
+    item = await aget_object_or_404(REGIONS, siren=siren_id)
+    return item
+
+
+@router.get(
+    "/departements",
+    response=List[DepartementListSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(FragmentsPagination)
+async def list_departements(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(DEPARTEMENTS, "departements", filters)
+    return queryset
+
+
+@router.get(
+    "/departements/{siren_id}", response=DepartementSchema, tags=["subdivisions"]
+)
+async def get_departement(request, siren_id):
+    item = await aget_object_or_404(DEPARTEMENTS, siren=siren_id)
+    await aattach_fragments([item])
+    return item
+
+
+@router.get(
+    "/epcis",
+    response=List[EpciSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(FragmentsPagination)
+async def list_epcis(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(EPCIS, "epcis", filters)
+    return queryset
+
+
+@router.get("/epcis/{siren_id}", response=EpciSchema, tags=["subdivisions"])
+async def get_epci(request, siren_id):
+    item = await aget_object_or_404(EPCIS, siren=siren_id)
+    return item
+
+
+@router.get(
+    "/communes",
+    response=List[CommuneListSchema],
+    exclude_unset=True,
+    tags=["subdivisions"],
+)
+@paginate(FragmentsPagination)
+async def list_communes(request, filters: ListFiltersSchema = Query(...)):
+    queryset = get_list_queryset(COMMUNES, "communes", filters)
+    return queryset
+
+
+@router.get(
+    "/communes/{commune_id}",
+    response={200: CommuneSchema, 404: dict},
+    tags=["subdivisions"],
+)
+@documented_as(api.get_commune)
+async def get_commune(request, commune_id):
+    if len(commune_id) == 9:
+        item = await aget_object_or_404(COMMUNES, siren=commune_id)
+    elif len(commune_id) == 5:
+        item = await aget_object_or_404(COMMUNES, insee=commune_id)
+    else:
+        return 404, {"message": "value is not a siren or insee id"}
+    await aattach_fragments([item])
+    return 200, item
+
+
+@router.get("/communes/siren/{siren_id}", response=CommuneSchema, tags=["subdivisions"])
+async def get_commune_by_siren(request, siren_id):
+    item = await aget_object_or_404(COMMUNES, siren=siren_id)
+    await aattach_fragments([item])
+    return item
+
+
+@router.get("/communes/insee/{insee_id}", response=CommuneSchema, tags=["subdivisions"])
+async def get_commune_by_insee(request, insee_id):
+    item = await aget_object_or_404(COMMUNES, insee=insee_id)
+    await aattach_fragments([item])
+    return item
+
+
+@router.get("/hierarchy", tags=["subdivisions"])
+@documented_as(api.get_hierarchy)
+async def get_hierarchy(request, year: int = None):
+    return await sync_to_async(get_hierarchy_response)(request, year)
+
+
+@router.get("/data/{level}", response=DataSchema, tags=["data"])
+@documented_as(api.get_data)
+async def get_data(request, level: str, codes: str, datacodes: str, years: str = None):
+    return await sync_to_async(get_data_values)(level, codes, datacodes, years)
+
+
+@router.get("/export/{level}.{export_format}", tags=["export"])
+@documented_as(api.export_subdivisions)
+async def export_subdivisions(
+    request, level: str, export_format: str, year: int = None, departement: str = None
+):
+    return export_response(level, export_format, year, departement, is_async=True)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path
+from ninja import NinjaAPI
+
+from francesubdivisions import api, async_api
+
+"""
+Compares the throughput of the sync (WSGI) and async (ASGI) versions of the API
+on the imported data, with concurrent requests made in-process.
+
+The network, the web server and the worker processes are not part of the measure:
+this compares the cost of the views, and how the sync views hold the threads
+while they wait on the database when the async ones yield.
+"""
+
+BENCHMARK_CACHE = "francesubdivisions-benchmark"
+
+
+class Command(BaseCommand):
+    help = "Benchmark the sync and async versions of the API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            type=str,
+            default="/subdivisions/mar",
+            help="Path of the requested endpoint, with its query string",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Number of requests"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Number of requests made at the same time",
+        )
+        parser.add_argument(
+            "--orjson",
+            action="store_true",
+            help="Render the responses with orjson, splicing the pre-encoded Fragments",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Disable the response cache, so that every request runs the view",
+        )
+
+    def handle(self, *args, **options):
+        renderer_options = {}
+        overrides = {}
+        if options["orjson"]:
+            from francesubdivisions.renderers import ORJSONRenderer
+
+            renderer_options["renderer"] = ORJSONRenderer()
+            overrides["FRANCESUBDIVISIONS_JSON_FRAGMENTS"] = True
+
+        sync_api = NinjaAPI(urls_namespace="benchmark-sync", **renderer_options)
+        sync_api.add_router("", api.router)
+        asgi_api = NinjaAPI(urls_namespace="benchmark-async", **renderer_options)
+        asgi_api.add_router("", async_api.router)
+        urlconf = ModuleType("benchmark_urls")
+        urlconf.urlpatterns = [
+            path("sync/", sync_api.urls),
+            path("async/", asgi_api.urls),
+        ]
+
+        overrides["ROOT_URLCONF"] = urlconf
+        if options["no_cache"]:
+            overrides["CACHES"] = {
+                **settings.CACHES,
+                BENCHMARK_CACHE: {
+                    "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+                },
+            }
+            overrides["FRANCESUBDIVISIONS_RESPONSE_CACHE"] = BENCHMARK_CACHE
+
+        print(
+            f"⏱️ Benchmarking {options['path']} with {options['requests']} requests, "
+            f"{options['concurrency']} at a time"
+        )
+        with override_settings(**overrides):
+            for name, run in [("sync", run_sync), ("async", run_async)]:
+                url = f"/{name}{options['path']}"
+                status = run(url, 1, 1)
+                if status != {200}:
+                    print(f"❌ {url} answered {', '.join(map(str, status))}")
+                    continue
+
+                start = time.perf_counter()
+                run(url, options["requests"], options["concurrency"])
+                duration = time.perf_counter() - start
+                print(
+                    f"✅ {name}: {options['requests'] / duration:.1f} requests/s "
+                    f"({duration * 1000 / options['requests']:.2f} ms per request)"
+                )
+
+
+def run_sync(url: str, requests: int, concurrency: int) -> set:
+    """
+    Makes the requests to the sync views from a pool of threads, as a WSGI server does
+    """
+    client = Client()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = executor.map(lambda _: client.get(url), range(requests))
+        return {response.status_code for response in responses}
+
+
+@async_to_sync
+async def run_async(url: str, requests: int, concurrency: int) -> set:
+    """
+    Makes the requests to the async views from a single event loop, as an ASGI server does
+    """
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get():
+        async with semaphore:
+            return await client.get(url)
+
+    responses = await asyncio.gather(*[get() for _ in range(requests)])
+    return {response.status_code for response in responses}
@@ -4,8 +4,12 @@
 from francesubdivisions.services.banatic import (
     import_commune_data_from_banatic,
     import_epci_data_from_banatic,
+    open_banatic_communes_archive,
 )
-from django.core.management.base import BaseCommand
+from francesubdivisions.services.cog import COG_MIN_YEAR
+from francesubdivisions.services.utils import parse_years
+from django.core.management.base import BaseCommand, CommandError
+from francesubdivisions.services.autocomplete import clear_search_indexes
 
 """
 Import de divers fichiers pour récupérer les données extraites de Banatic
@@ -30,11 +34,43 @@ class Command(BaseCommand):
                 Caution: the script expects the previous levels to be already parsed",
             choices=["communes", "epci"],
         )
-        parser.add_argument(
+        years_group = parser.add_mutually_exclusive_group()
+        years_group.add_argument(
             "--year", type=int, help="If specified, only that year will be parsed"
         )
+        years_group.add_argument(
+            "--years",
+            type=parse_years,
+            help="If specified, these years will be parsed, in order. \
+                Format: 2019-2021 or 2019,2021",
+        )
+        years_group.add_argument(
+            "--all-years",
+            action="store_true",
+            help="If specified, all the available years will be parsed, in order",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Import the source files even if they did not change since their last import",
+        )
+        parser.add_argument(
+            "--from-dir",
+            type=str,
+            help="Read the source files from that directory instead of downloading them",
+        )
+        parser.add_argument(
+            "--file",
+            type=str,
+            help="Read the source file of the level specified with --level \
+                from that path instead of downloading it",
+        )
 
     def handle(self, *args, **options):
+        if options["file"] and not options["level"]:
+            raise CommandError("--file can only be used along with --level")
+        local_files = {"from_dir": options["from_dir"], "file": options["file"]}
+
         message = "📥 Importing data from Banatic"
 
         if options["level"]:
@@ -45,20 +81,40 @@ class Command(BaseCommand):
             level = None
             all_levels = True
 
-        if options["year"]:
-            year = int(options["year"])
-            message += f" for year {year}"
+        if options["all_years"]:
+            message += f" for all the available years"
+            years = []
+        elif options["years"]:
+            years = options["years"]
+            message += f" for years {', '.join(str(y) for y in years)}"
+        elif options["year"]:
+            years = [int(options["year"])]
+            message += f" for year {years[0]}"
         else:
             message += f" for the latest available year"
-            year = 0
+            years = [0]
 
         print(message)
         # Now adding the Siren <-> Insee table for Communes first, then the epci and EPCI <=> communes relations
 
         # Import of the Siren <-> Insee table for Communes
         # That file also has population data
+        # The archive holds all the years, so it is opened only once
         if all_levels or level == "communes":
-            import_commune_data_from_banatic(year)
+            with open_banatic_communes_archive(**local_files) as archive:
+                if options["all_years"]:
+                    years = [
+                        y for y in sorted(archive["annual_files"]) if y >= COG_MIN_YEAR
+                    ]
+
+                for year in years:
+                    import_commune_data_from_banatic(
+                        year, force=options["force"], archive=archive
+                    )
 
+        # The EPCI file is currently only available for one year
         if all_levels or level == "epci":
-            import_epci_data_from_banatic(year)
+            year = years[-1] if years else 0
+            import_epci_data_from_banatic(year, force=options["force"], **local_files)
+
+        clear_search_indexes()
@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from francesubdivisions.services.autocomplete import clear_search_indexes
 from francesubdivisions.models import Commune, Departement, Region, DataYear, Metadata
 from os import path
 
 from francesubdivisions.services.cog import (
+    COG_ID,
+    get_cog_years,
     import_communes_from_cog,
     import_departements_from_cog,
     import_regions_from_cog,
 )
-from francesubdivisions.services.utils import add_sirens_and_categories
+from francesubdivisions.services.datagouv import get_datagouv_manifest
+from francesubdivisions.services.utils import add_sirens_and_categories, parse_years
 
 """
 Ce script récupère les données de
@@ -34,11 +38,58 @@ class Command(BaseCommand):
                 Caution: the script expects the previous levels to be already parsed",
             choices=["regions", "departements", "communes"],
         )
-        parser.add_argument(
+        years_group = parser.add_mutually_exclusive_group()
+        years_group.add_argument(
             "--year", type=int, help="If specified, only that year will be parsed"
         )
+        years_group.add_argument(
+            "--years",
+            type=parse_years,
+            help="If specified, these years will be parsed, in order. \
+                Format: 2019-2021 or 2019,2021",
+        )
+        years_group.add_argument(
+            "--all-years",
+            action="store_true",
+            help="If specified, all the available years will be parsed, in order",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Import the source files even if they did not change since their last import",
+        )
+        parser.add_argument(
+            "--from-dir",
+            type=str,
+            help="Read the source files (and data.gouv.fr dataset manifests) \
+                from that directory instead of downloading them",
+        )
+        parser.add_argument(
+            "--file",
+            type=str,
+            help="Read the source file of the level specified with --level \
+                from that path instead of downloading it. Requires --from-dir, \
+                for the dataset manifest describing the file",
+        )
+        parser.add_argument(
+            "--no-bulk",
+            action="store_true",
+            help="Import the communes row by row instead of using bulk queries",
+        )
 
     def handle(self, *args, **options):
+        if options["file"] and not options["level"]:
+            raise CommandError("--file can only be used along with --level")
+        if options["file"] and (options["years"] or options["all_years"]):
+            raise CommandError("--file can only be used for a single year")
+        if options["file"] and not options["from_dir"]:
+            # The year, title and url of the file are read from the dataset manifest
+            raise CommandError(
+                "--file can only be used along with --from-dir, holding the dataset "
+                "manifest"
+            )
+        local_files = {"from_dir": options["from_dir"], "file": options["file"]}
+
         if options["level"]:
             level = options["level"]
             all_levels = False
@@ -46,35 +97,62 @@ class Command(BaseCommand):
             level = None
             all_levels = True
 
-        if options["year"]:
-            year = int(options["year"])
+        # The dataset manifest is fetched once for all the levels and years
+        manifest = get_datagouv_manifest(COG_ID, options["from_dir"])
+
+        if options["all_years"]:
+            years = get_cog_years(manifest)
+        elif options["years"]:
+            years = options["years"]
+        elif options["year"]:
+            years = [int(options["year"])]
         else:
-            year = 0
+            years = [0]
+
+        for year in years:
+            self.import_year(year, level, all_levels, local_files, manifest, options)
+
+        clear_search_indexes()
 
+    def import_year(self, year, level, all_levels, local_files, manifest, options):
         # Now going down from higher level: Régions, Départements, Communes
 
         # Régions
         if all_levels or level == "regions":
             # First import data from the COG
-            response = import_regions_from_cog(year)
+            response = import_regions_from_cog(
+                year, force=options["force"], manifest=manifest, **local_files
+            )
 
             # Then the SIRENs from a local file
-            regions_list = path.join(
-                "francesubdivisions", "resources", "regions-siren.csv"
-            )
-            add_sirens_and_categories(regions_list, Region, response["year_entry"])
+            if not response["skipped"]:
+                regions_list = path.join(
+                    "francesubdivisions", "resources", "regions-siren.csv"
+                )
+                add_sirens_and_categories(regions_list, Region, response["year_entry"])
 
         # Départements
         if all_levels or level == "departements":
             # First import data from the COG
-            response = import_departements_from_cog(year)
+            response = import_departements_from_cog(
+                year, force=options["force"], manifest=manifest, **local_files
+            )
 
             # Then the SIRENs from a local file
-            depts_list = path.join(
-                "francesubdivisions", "resources", "departements-siren.csv"
-            )
-            add_sirens_and_categories(depts_list, Departement, response["year_entry"])
+            if not response["skipped"]:
+                depts_list = path.join(
+                    "francesubdivisions", "resources", "departements-siren.csv"
+                )
+                add_sirens_and_categories(
+                    depts_list, Departement, response["year_entry"]
+                )
 
         # Communes
         if all_levels or level == "communes":
-            response = import_communes_from_cog(year)
+            response = import_communes_from_cog(
+                year,
+                bulk=not options["no_bulk"],
+                force=options["force"],
+                manifest=manifest,
+                **local_files,
+            )
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("francesubdivisions", "0033_alter_commune_insee"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datasource",
+            name="import_duration",
+            field=models.DurationField(
+                blank=True, null=True, verbose_name="durée d’import"
+            ),
+        ),
+        migrations.AddField(
+            model_name="datasource",
+            name="row_count",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="nombre de lignes"
+            ),
+        ),
+        migrations.AddField(
+            model_name="datasource",
+            name="sha256",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="empreinte SHA-256"
+            ),
+        ),
+    ]
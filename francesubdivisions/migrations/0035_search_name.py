@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from unidecode import unidecode
+
+
+def populate_search_names(apps, schema_editor):
+    for model_name in ["Region", "Departement", "Epci", "Commune"]:
+        model = apps.get_model("francesubdivisions", model_name)
+        entries = list(model.objects.only("id", "name"))
+        for entry in entries:
+            entry.search_name = unidecode(entry.name).lower()
+        model.objects.bulk_update(entries, ["search_name"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("francesubdivisions", "0034_datasource_fingerprint"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="commune",
+            name="search_name",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                max_length=100,
+                verbose_name="nom de recherche",
+            ),
+        ),
+        migrations.AddField(
+            model_name="departement",
+            name="search_name",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                max_length=100,
+                verbose_name="nom de recherche",
+            ),
+        ),
+        migrations.AddField(
+            model_name="epci",
+            name="search_name",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                max_length=100,
+                verbose_name="nom de recherche",
+            ),
+        ),
+        migrations.AddField(
+            model_name="region",
+            name="search_name",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                max_length=100,
+                verbose_name="nom de recherche",
+            ),
+        ),
+        migrations.RunPython(populate_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="commune",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_name"],
+                name="commune_search_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="commune",
+            index=models.Index(
+                fields=["search_name"],
+                name="commune_search_name_like",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="departement",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_name"],
+                name="departement_search_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="departement",
+            index=models.Index(
+                fields=["search_name"],
+                name="departement_search_name_like",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="epci",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_name"],
+                name="epci_search_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="epci",
+            index=models.Index(
+                fields=["search_name"],
+                name="epci_search_name_like",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="region",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_name"],
+                name="region_search_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="region",
+            index=models.Index(
+                fields=["search_name"],
+                name="region_search_name_like",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def create_data_version(apps, schema_editor):
+    Metadata = apps.get_model("francesubdivisions", "Metadata")
+    Metadata.objects.get_or_create(
+        prop="data_version", defaults={"value": timezone.now().isoformat()}
+    )
+
+
+def delete_data_version(apps, schema_editor):
+    Metadata = apps.get_model("francesubdivisions", "Metadata")
+    Metadata.objects.filter(prop="data_version").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("francesubdivisions", "0035_search_name"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_data_version, delete_data_version),
+    ]
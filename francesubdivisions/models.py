@@ -1,9 +1,13 @@
+from datetime import timedelta
+from typing import Iterable
+
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
-from django.db.models import Max
 from django.db.models.query import QuerySet
 from django.utils.text import slugify
 
 from francesubdivisions.services.django_admin import TimeStampModel
+from francesubdivisions.services.utils import BULK_BATCH_SIZE, normalize_name
 from francesubdivisions.services.validators import (
     validate_insee_region,
     validate_insee_departement,
@@ -52,6 +56,9 @@ class DataSource(TimeStampModel):
     year = models.ForeignKey(
         "DataYear", on_delete=models.RESTRICT, verbose_name="millésime"
     )
+    sha256 = models.CharField("empreinte SHA-256", max_length=64, blank=True)
+    row_count = models.PositiveIntegerField("nombre de lignes", blank=True, null=True)
+    import_duration = models.DurationField("durée d’import", blank=True, null=True)
 
     def __str__(self):
         return f"{self.title} ({self.year})"
@@ -60,26 +67,74 @@ class DataSource(TimeStampModel):
         verbose_name = "source"
         unique_together = (("title", "url", "year"),)
 
+    def is_unchanged(self, sha256: str) -> bool:
+        """
+        Checks if a file with that fingerprint was already fully imported
+        """
+        return self.sha256 == sha256 and self.row_count is not None
+
+    def record_import(
+        self, sha256: str, row_count: int, import_duration: timedelta
+    ) -> None:
+        self.sha256 = sha256
+        self.row_count = row_count
+        self.import_duration = import_duration
+        self.save(
+            update_fields=["sha256", "row_count", "import_duration", "updated_at"]
+        )
+
 
 # France administrative structure models
 
 
+def search_name_indexes(prefix: str) -> list:
+    """
+    Indexes on the search_name field: a trigram index for the "contains" queries
+    and a pattern btree for the "startswith" queries
+    """
+    return [
+        GinIndex(
+            fields=["search_name"],
+            name=f"{prefix}_search_name_trgm",
+            opclasses=["gin_trgm_ops"],
+        ),
+        models.Index(
+            fields=["search_name"],
+            name=f"{prefix}_search_name_like",
+            opclasses=["varchar_pattern_ops"],
+        ),
+    ]
+
+
 class CollectivityModel(TimeStampModel):
     """
     Abstract model for common methods used by the following ones
     """
 
+    # Name without accents and in lowercase, as the search queries are normalized
+    search_name = models.CharField(
+        "nom de recherche", max_length=100, blank=True, default="", editable=False
+    )
+
+    # Name of the level in the API and the year resolver, set on each concrete model
+    level = None
+
     class Meta:
         abstract = True
 
     def get_data(self, year: int = None, datacode: str = None):
         """
-        Get the data for the given year (by default, the most recent one)
+        Get the data for the given year (by default, the current one of the level)
         If a datacode is provided, return only this data point
         """
         if not year:
-            year = self.years.aggregate(Max("year"))["year__max"]
-        data = self.regiondata_set.filter(year__year=year)
+            # Imported here as the year resolver depends on the models
+            from francesubdivisions.services.years import get_current_year
+
+            year = get_current_year(self.level).year
+        # Reverse relation of the data model of the level, e.g. commune.communedata_set
+        data_set = getattr(self, f"{self._meta.model_name}data_set")
+        data = data_set.filter(year__year=year)
 
         if datacode:
             data = data.filter(datacode=datacode)
@@ -89,9 +144,13 @@ class CollectivityModel(TimeStampModel):
     def create_slug(self):
         self.slug = slugify(self.name)
 
+    def create_search_name(self):
+        self.search_name = normalize_name(self.name)
+
     def save(self, *args, **kwargs):
         self.full_clean()
         self.create_slug()
+        self.create_search_name()
         return super().save(*args, **kwargs)
 
 
@@ -100,6 +159,8 @@ class Region(CollectivityModel):
     A French région
     """
 
+    level = "regions"
+
     class RegionCategory(models.TextChoices):
         REG = "REG", "Région"
         CTU = "CTU", "Collectivité territoriale unique"
@@ -124,6 +185,7 @@ class Region(CollectivityModel):
     class Meta:
         verbose_name = "région"
         unique_together = (("name", "insee"),)
+        indexes = search_name_indexes("region")
 
     def __str__(self):
         return self.name
@@ -140,6 +202,8 @@ class Departement(CollectivityModel):
     A French département
     """
 
+    level = "departements"
+
     class DepartementCategory(models.TextChoices):
         DEPT = "DEPT", "Département"
         PARIS = "PARIS", "Paris"
@@ -167,6 +231,7 @@ class Departement(CollectivityModel):
 
     class Meta:
         verbose_name = "département"
+        indexes = search_name_indexes("departement")
 
     def __str__(self):
         return f"{self.insee} - {self.name}"
@@ -188,6 +253,8 @@ class Epci(CollectivityModel):
     à fiscalité propre
     """
 
+    level = "epcis"
+
     class EpciType(models.TextChoices):
         CA = "CA", "Communauté d’agglomération"
         CC = "CC", "Communauté de communes"
@@ -209,6 +276,7 @@ class Epci(CollectivityModel):
 
     class Meta:
         verbose_name = "EPCI"
+        indexes = search_name_indexes("epci")
 
     def __str__(self):
         return self.name
@@ -222,6 +290,8 @@ class Commune(CollectivityModel):
     A French commune
     """
 
+    level = "communes"
+
     name = models.CharField("nom", max_length=100)
     years = models.ManyToManyField(DataYear, verbose_name="millésimes")
     departement = models.ForeignKey(
@@ -241,6 +311,7 @@ class Commune(CollectivityModel):
 
     class Meta:
         verbose_name = "commune"
+        indexes = search_name_indexes("commune")
 
     def __str__(self):
         return f"{self.name} ({self.departement})"
@@ -250,11 +321,49 @@ class Commune(CollectivityModel):
 
 
 # France collectivities data models
+class CollectivityDataManager(models.Manager):
+    """
+    Manager for the collectivity data models
+    """
+
+    def upsert(self, rows: Iterable[tuple], batch_size: int = BULK_BATCH_SIZE) -> int:
+        """
+        Insert or update data points in bulk
+
+        rows: (collectivity_id, year_id, datacode, value, datatype, source_id) tuples
+        Existing data points (same collectivity, year and datacode) get their value,
+        datatype and source updated in place.
+        """
+        collectivity_field = self.model.collectivity_field
+        entries = [
+            self.model(
+                **{f"{collectivity_field}_id": collectivity_id},
+                year_id=year_id,
+                datacode=datacode,
+                value=value,
+                datatype=datatype,
+                source_id=source_id,
+            )
+            for collectivity_id, year_id, datacode, value, datatype, source_id in rows
+        ]
+        self.bulk_create(
+            entries,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=[collectivity_field, "year", "datacode"],
+            update_fields=["value", "datatype", "source", "updated_at"],
+        )
+        return len(entries)
+
+
 class CollectivityDataModel(TimeStampModel):
     """
     Abstract model for common methods used by the following ones
     """
 
+    # Name of the foreign key to the collectivity, set on each concrete model
+    collectivity_field = None
+
     # (Missing here: "collectivity" variable, specific to the relevant collectivity level)
     year = models.ForeignKey(
         "DataYear", on_delete=models.PROTECT, verbose_name="millésime"
@@ -266,11 +375,14 @@ class CollectivityDataModel(TimeStampModel):
         "DataSource", on_delete=models.PROTECT, verbose_name="source"
     )
 
+    objects = CollectivityDataManager()
+
     class Meta:
         abstract = True
 
 
 class RegionData(CollectivityDataModel):
+    collectivity_field = "region"
     region = models.ForeignKey(
         "Region", on_delete=models.CASCADE, verbose_name="région"
     )
@@ -289,6 +401,7 @@ class RegionData(CollectivityDataModel):
 
 
 class DepartementData(CollectivityDataModel):
+    collectivity_field = "departement"
     departement = models.ForeignKey(
         "Departement", on_delete=models.CASCADE, verbose_name="département"
     )
@@ -308,6 +421,7 @@ class DepartementData(CollectivityDataModel):
 
 
 class EpciData(CollectivityDataModel):
+    collectivity_field = "epci"
     epci = models.ForeignKey("Epci", on_delete=models.CASCADE, verbose_name="EPCI")
 
     class Meta:
@@ -325,6 +439,7 @@ class EpciData(CollectivityDataModel):
 
 
 class CommuneData(CollectivityDataModel):
+    collectivity_field = "commune"
     commune = models.ForeignKey(
         "Commune", on_delete=models.CASCADE, verbose_name="commune"
     )
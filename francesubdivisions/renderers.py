@@ -0,0 +1,55 @@
+"""
+JSON renderer backed by orjson, for the NinjaAPI of the host project:
+
+    api = NinjaAPI(renderer=ORJSONRenderer())
+
+It splices the JSON of the pre-serialized entries (see services/fragments.py)
+in the responses, instead of encoding them again. orjson is an optional dependency.
+"""
+
+import re
+import secrets
+
+from django.core.exceptions import ImproperlyConfigured
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+
+from francesubdivisions.services.fragments import Fragment
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The Fragments are first encoded as strings holding this mark and their index
+FRAGMENT_MARK = f"francesubdivisions-fragment-{secrets.token_hex(8)}:"
+FRAGMENT_PATTERN = re.compile(rb'"' + re.escape(FRAGMENT_MARK.encode()) + rb'(\d+)"')
+
+# Encodes the types that orjson doesn't support natively (lazy strings, models...)
+fallback_encoder = NinjaJSONEncoder()
+
+
+def dumps(data) -> bytes:
+    fragments = []
+
+    def default(value):
+        if isinstance(value, Fragment):
+            fragments.append(value.json)
+            return f"{FRAGMENT_MARK}{len(fragments) - 1}"
+        return fallback_encoder.default(value)
+
+    content = orjson.dumps(data, default=default)
+    if not fragments:
+        return content
+    return FRAGMENT_PATTERN.sub(lambda match: fragments[int(match[1])], content)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImproperlyConfigured("ORJSONRenderer requires orjson to be installed")
+
+    def render(self, request, data, *, response_status: int) -> bytes:
+        return dumps(data)
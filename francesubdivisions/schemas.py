@@ -1,5 +1,10 @@
-from ninja import Schema
-from typing import List
+from ninja import Field, Schema
+from typing import List, Optional
+
+from francesubdivisions.services.fragments import Prerendered, get_nested_fragment
+
+# Maximal number of codes resolved in one request
+RESOLVE_MAX_CODES = 50000
 
 
 class DataYearSchema(Schema):
@@ -8,34 +13,98 @@ class DataYearSchema(Schema):
 
 class RegionSchema(Schema):
     id: int
-    name: str = None
-    insee: str = None
-    siren: str = None
+    name: Optional[str] = None
+    insee: Optional[str] = None
+    siren: Optional[str] = None
     years: List[DataYearSchema]
 
 
 class DepartementSchema(Schema):
     id: int
-    name: str = None
-    insee: str = None
-    siren: str = None
-    region: RegionSchema = None
-    years: List[DataYearSchema] = None
+    name: Optional[str] = None
+    insee: Optional[str] = None
+    siren: Optional[str] = None
+    region: Optional[Prerendered[RegionSchema]] = None
+    years: Optional[List[DataYearSchema]] = None
+
+    # The dicts of the flat items have no relation, it is then left unset
+    @staticmethod
+    def resolve_region(obj):
+        return get_nested_fragment(obj, "regions", obj.region_id)
 
 
 class EpciSchema(Schema):
     id: int
-    name: str = None
-    siren: str = None
-    years: List[DataYearSchema] = None
+    name: Optional[str] = None
+    siren: Optional[str] = None
+    years: Optional[List[DataYearSchema]] = None
 
 
 class CommuneSchema(Schema):
     id: int
-    name: str = None
-    insee: str = None
-    siren: str = None
-    epci: EpciSchema = None
-    departement: DepartementSchema = None
-    population: int = None
-    years: List[DataYearSchema] = None
+    name: Optional[str] = None
+    insee: Optional[str] = None
+    siren: Optional[str] = None
+    epci: Optional[Prerendered[EpciSchema]] = None
+    departement: Optional[Prerendered[DepartementSchema]] = None
+    population: Optional[int] = None
+    years: Optional[List[DataYearSchema]] = None
+
+    @staticmethod
+    def resolve_epci(obj):
+        return get_nested_fragment(obj, "epcis", obj.epci_id)
+
+    @staticmethod
+    def resolve_departement(obj):
+        return get_nested_fragment(obj, "departements", obj.departement_id)
+
+
+class RegionListSchema(RegionSchema):
+    years: Optional[List[DataYearSchema]] = None
+
+
+class DepartementListSchema(DepartementSchema):
+    region_insee: Optional[str] = None
+
+
+class CommuneListSchema(CommuneSchema):
+    departement_insee: Optional[str] = None
+    epci_siren: Optional[str] = None
+
+
+class ListFiltersSchema(Schema):
+    fields: Optional[str] = Field(
+        None,
+        description="Comma-separated names of the fields to return, "
+        "as codes for the relations",
+    )
+    flat: bool = Field(
+        False, description="Return all the fields, with the relations as codes"
+    )
+
+
+class ResolveSchema(Schema):
+    codes: List[str] = Field(..., max_length=RESOLVE_MAX_CODES)
+
+
+class DepartementResolveSchema(Schema):
+    items: List[DepartementSchema]
+    missing: List[str]
+
+
+class EpciResolveSchema(Schema):
+    items: List[EpciSchema]
+    missing: List[str]
+
+
+class CommuneResolveSchema(Schema):
+    items: List[CommuneSchema]
+    missing: List[str]
+
+
+class DataSchema(Schema):
+    codes: List[str]
+    years: List[int]
+    datacodes: List[str]
+    # values[code][year][datacode], None for the missing data points
+    values: List[List[List[Optional[str]]]]
@@ -0,0 +1,293 @@
+"""
+In-process autocomplete index for the subdivisions search.
+
+For each level and year, the normalized names are kept in a sorted list,
+so that prefix queries are answered with a binary search instead of
+a database query.
+"""
+
+import heapq
+import time
+from bisect import bisect_left
+from operator import itemgetter
+from threading import Lock
+from typing import Iterable
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Q, QuerySet, Value, When
+
+from francesubdivisions.models import Commune, Departement, Epci, Region
+from francesubdivisions.services.data_version import get_data_version
+from francesubdivisions.services.utils import normalize_name
+
+# The communes whose name is shorter than the minimal query length
+SHORTNAMED_COMMUNES = [
+    "by",
+    "bu",
+    "eu",
+    "gy",
+    "oz",
+    "oo",
+    "py",
+    "ri",
+    "ry",
+    "sy",
+    "ur",
+    "us",
+    "uz",
+    "y",
+]
+
+# Minimal delay (in seconds) between two checks that the indexes are up to date
+INDEX_CHECK_INTERVAL = 60
+
+# The characters after which a word starts in the normalized names
+WORD_SEPARATORS = " -'"
+
+# Relevance ranks of the matches, from the most relevant one
+EXACT_MATCH, PREFIX_MATCH, WORD_PREFIX_MATCH, OTHER_MATCH = range(4)
+
+
+def region_item(region: Region) -> dict:
+    return {
+        "value": region.siren,
+        "text": region.name,
+        "type": "region",
+        "slug": region.slug,
+    }
+
+
+def departement_item(departement: Departement) -> dict:
+    return {
+        "value": departement.siren,
+        "text": departement.name,
+        "type": "departement",
+        "slug": departement.slug,
+    }
+
+
+def epci_item(epci: Epci) -> dict:
+    return {"value": epci.siren, "text": epci.name, "type": "epci", "slug": epci.slug}
+
+
+def commune_item(commune: Commune) -> dict:
+    return {
+        "value": commune.siren,
+        "text": f"{commune.name} ({commune.insee})",
+        "name": commune.name,
+        "insee": commune.insee,
+        "type": "commune",
+        "slug": commune.slug,
+    }
+
+
+def match_rank(query: str, key: str) -> int:
+    if key == query:
+        return EXACT_MATCH
+    if key.startswith(query):
+        return PREFIX_MATCH
+    if any(f"{separator}{query}" in key for separator in WORD_SEPARATORS):
+        return WORD_PREFIX_MATCH
+    return OTHER_MATCH
+
+
+def relevance(query: str):
+    """
+    Sort key of the (normalized name, population, item) triples: the best matches
+    first, then the most populated communes, then by name
+    """
+
+    def key(entry: tuple) -> tuple:
+        name, population, _item = entry
+        return (match_rank(query, name), -(population or 0), name)
+
+    return key
+
+
+def word_start_filter(query: str) -> Q:
+    """
+    Matches the names with a word (but the first one) starting with query
+    """
+    word_start = Q()
+    for separator in WORD_SEPARATORS:
+        word_start |= Q(search_name__contains=f"{separator}{query}")
+    return word_start
+
+
+def rank_queryset(queryset: QuerySet, query: str) -> QuerySet:
+    """
+    Orders the matches of a search by relevance, in the same order as relevance()
+    """
+    queryset = queryset.annotate(
+        match_rank=Case(
+            When(search_name=query, then=Value(EXACT_MATCH)),
+            When(search_name__startswith=query, then=Value(PREFIX_MATCH)),
+            When(word_start_filter(query), then=Value(WORD_PREFIX_MATCH)),
+            default=Value(OTHER_MATCH),
+            output_field=IntegerField(),
+        )
+    )
+    if hasattr(queryset.model, "population"):
+        return queryset.order_by(
+            "match_rank", F("population").desc(nulls_last=True), "search_name"
+        )
+    return queryset.order_by("match_rank", "search_name")
+
+
+class SearchIndex:
+    """
+    The search items of one level and year, sorted by normalized name
+    """
+
+    def __init__(self, entries: list):
+        """
+        entries: (name, item, population) triples, the population being None
+        for the levels that have none
+        """
+        entries = sorted(
+            (
+                (normalize_name(name), item, population)
+                for name, item, population in entries
+            ),
+            key=itemgetter(0),
+        )
+        self.keys = [key for key, _item, _population in entries]
+        self.items = [item for _key, item, _population in entries]
+        self.populations = [population for _key, _item, population in entries]
+
+        # The end of the keys from the start of each of their words but the first,
+        # so that the matches at the start of a word are also found by bisection
+        word_starts = sorted(
+            (key[i:], position)
+            for position, key in enumerate(self.keys)
+            for i in range(1, len(key))
+            if key[i - 1] in WORD_SEPARATORS
+        )
+        self.word_keys = [word_key for word_key, _position in word_starts]
+        self.word_positions = [position for _word_key, position in word_starts]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def startswith(self, prefix: str, limit: int = None) -> list:
+        return self.rank(prefix, prefix_range(self.keys, prefix), limit)
+
+    def word_startswith(self, prefix: str, limit: int = None) -> list:
+        """
+        Returns the items whose name, or one of its words, starts with prefix
+        """
+        positions = set(prefix_range(self.keys, prefix))
+        positions.update(
+            self.word_positions[i] for i in prefix_range(self.word_keys, prefix)
+        )
+        return self.rank(prefix, positions, limit)
+
+    def exact(self, query: str, limit: int = None) -> list:
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, query + "\x00", lo=start)
+        return self.rank(query, range(start, end), limit)
+
+    def contains(self, query: str, limit: int = None) -> list:
+        positions = (i for i, key in enumerate(self.keys) if query in key)
+        return self.rank(query, positions, limit)
+
+    def rank(self, query: str, positions: Iterable[int], limit: int = None) -> list:
+        """
+        Returns the items at the given positions by relevance, up to limit items
+        """
+        entries = (
+            (self.keys[i], self.populations[i], self.items[i]) for i in positions
+        )
+        if limit is None:
+            entries = sorted(entries, key=relevance(query))
+        else:
+            entries = heapq.nsmallest(limit, entries, key=relevance(query))
+        return [item for _key, _population, item in entries]
+
+
+def prefix_range(keys: list, prefix: str) -> range:
+    """
+    Returns the positions of the sorted keys that start with prefix
+    """
+    start = bisect_left(keys, prefix)
+    end = bisect_left(keys, prefix + "\uffff", lo=start)
+    return range(start, end)
+
+
+def build_search_index(level: str, year: int) -> SearchIndex:
+    if level == "regions":
+        # Exclude Mayotte that has no region-level Siren
+        queryset = Region.objects.filter(years__year=year).exclude(siren__exact="")
+        get_item = region_item
+    elif level == "departements":
+        # Exclude Haute-Corse, Corse-du-Sud, Martinique and Guyane that have no departement-level Siren
+        queryset = Departement.objects.filter(years__year=year).exclude(siren__exact="")
+        get_item = departement_item
+    elif level == "epcis":
+        queryset = Epci.objects.filter(years__year=year)
+        get_item = epci_item
+    elif level == "communes":
+        queryset = Commune.objects.filter(years__year=year)
+        get_item = commune_item
+    else:
+        raise ValueError(f"Unknown level {level}")
+
+    # Only the communes have a population, which ranks the matches
+    return SearchIndex(
+        [
+            (entry.name, get_item(entry), getattr(entry, "population", None))
+            for entry in queryset.iterator()
+        ]
+    )
+
+
+_indexes = {}
+_indexes_lock = Lock()
+_indexes_version = None
+_last_check = 0
+
+
+def search_index_enabled() -> bool:
+    return getattr(settings, "FRANCESUBDIVISIONS_SEARCH_INDEX", True)
+
+
+def get_search_index(level: str, year: int) -> SearchIndex:
+    """
+    Returns the search index of the given level and year, building it if needed
+    """
+    with _indexes_lock:
+        check_search_indexes()
+        key = (level, year)
+        if key not in _indexes:
+            _indexes[key] = build_search_index(level, year)
+        return _indexes[key]
+
+
+def check_search_indexes() -> None:
+    """
+    Drops the indexes if the data changed since they were built
+    (imports and admin edits may run in another process, so the data version
+    is checked periodically)
+    """
+    global _indexes_version, _last_check
+
+    now = time.monotonic()
+    if now - _last_check < INDEX_CHECK_INTERVAL:
+        return
+    _last_check = now
+
+    version = get_data_version()
+    if version != _indexes_version:
+        _indexes.clear()
+        _indexes_version = version
+
+
+def clear_search_indexes() -> None:
+    """
+    Drops all the indexes, so that they are rebuilt on their next use
+    """
+    global _last_check
+
+    with _indexes_lock:
+        _indexes.clear()
+        _last_check = 0
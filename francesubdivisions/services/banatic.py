@@ -1,13 +1,24 @@
 import csv
 import re
-import requests
+import time
+from contextlib import contextmanager
 from zipfile import ZipFile
-from io import BytesIO, StringIO
+from io import TextIOWrapper
 import openpyxl_dictreader
-from datetime import datetime
-from typing import Pattern
+from datetime import datetime, timedelta
+from typing import Iterable, Pattern
 
-from francesubdivisions.models import Epci, Commune, DataYear, Metadata
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from francesubdivisions.models import Epci, Commune, DataSource, DataYear, Metadata
+from francesubdivisions.services.utils import (
+    BULK_BATCH_SIZE,
+    get_file_sha256,
+    get_local_path,
+    open_url,
+)
 
 from pprint import pprint
 
@@ -15,32 +26,85 @@ from pprint import pprint
 
 BANATIC_ID = "5e1f20058b4c414d3f94460d"
 
+BANATIC_COMMUNES_URL = "https://www.banatic.interieur.gouv.fr/V5/ressources/documents/document_reference/TableCorrespondanceSirenInsee.zip"
+BANATIC_COMMUNES_MIN_YEAR = 2014
 
-def import_commune_data_from_banatic(year: int = 0) -> None:
-    # Imports the Siren <-> Insee table for Communes
-    # Communes must have been imported beforehand from COG
+# The EPCI file url has no usable file name, so its local copy is named this way
+EPCI_LOCAL_FILENAME = "perimetre-epci.tsv"
 
-    zip_url = "https://www.banatic.interieur.gouv.fr/V5/ressources/documents/document_reference/TableCorrespondanceSirenInsee.zip"
-    print(f"🗜️   Parsing archive {zip_url}")
 
-    zip_name = requests.get(zip_url).content
+@contextmanager
+def open_banatic_communes_archive(from_dir: str = None, file: str = None) -> dict:
+    """
+    Opens the Banatic archive with the Siren <-> Insee tables of all years,
+    so that several years can be imported from a single download.
+
+    Yields a dict with the opened zip_file, its annual_files and its sha256.
+    """
+    print(f"🗜️   Parsing archive {BANATIC_COMMUNES_URL}")
+    local_path = get_local_path(BANATIC_COMMUNES_URL, from_dir, file)
+    with open_url(BANATIC_COMMUNES_URL, local_path) as source_file:
+        sha256 = get_file_sha256(source_file)
+        with ZipFile(source_file) as zip_file:
+            title_regex = re.compile(r"Banatic_SirenInsee(?P<year>\d{4})\.xlsx")
+            annual_files = match_filenames_in_zip(
+                zip_file, title_regex, starting_year=BANATIC_COMMUNES_MIN_YEAR
+            )
+            yield {"zip_file": zip_file, "annual_files": annual_files, "sha256": sha256}
+
+
+def import_commune_data_from_banatic(
+    year: int = 0,
+    force: bool = False,
+    from_dir: str = None,
+    file: str = None,
+    archive: dict = None,
+) -> None:
+    # Imports the Siren <-> Insee table for Communes
+    # Communes must have been imported beforehand from COG
 
-    with ZipFile(BytesIO(zip_name)) as zip_file:
-        title_regex = re.compile(r"Banatic_SirenInsee(?P<year>\d{4})\.xlsx")
-        annual_files = match_filenames_in_zip(zip_file, title_regex, starting_year=2014)
+    # The archive may already have been opened to import other years
+    if archive is None:
+        with open_banatic_communes_archive(from_dir, file) as archive:
+            return import_commune_data_from_banatic(year, force, archive=archive)
 
-        if not year:
-            year = max(annual_files)
-        year_entry, _year_return_code = DataYear.objects.get_or_create(year=year)
-        print(f"Importing data for year {year_entry}")
+    start_time = time.monotonic()
+    annual_files = archive["annual_files"]
+    sha256 = archive["sha256"]
 
-        with zip_file.open(annual_files[year]) as xlsx_file:
-            reader = openpyxl_dictreader.DictReader(xlsx_file, "insee_siren")
-            for row in reader:
-                print(f"Importing row data for {row['nom_com']} ({row['insee']})")
-                import_commune_row_from_banatic(row, year_entry)
+    if not year:
+        year = max(annual_files)
+    year_entry, _year_return_code = DataYear.objects.get_or_create(year=year)
 
-        Metadata.objects.get_or_create(prop="banatic_communes_year", value=year)
+    source_entry, _source_return_code = DataSource.objects.get_or_create(
+        title="Banatic Table de correspondance Siren / Insee des communes",
+        url=BANATIC_COMMUNES_URL,
+        year=year_entry,
+    )
+    if not force and source_entry.is_unchanged(sha256):
+        print(f"⏭️   {source_entry} unchanged since its last import, skipped.")
+        return
+
+    print(f"Importing data for year {year_entry}")
+
+    with archive["zip_file"].open(annual_files[year]) as xlsx_file:
+        reader = openpyxl_dictreader.DictReader(xlsx_file, "insee_siren")
+        report = bulk_import_commune_rows_from_banatic(reader, year_entry)
+
+    print(f"{report['updated']} communes updated.")
+    for insee, name in report["not_found"]:
+        print(f"Commune {name} ({insee}) not found")
+    for insee, name, db_name in report["name_mismatches"]:
+        print(
+            f"Commune name {name} ({insee}) doesn't match with database entry {db_name}"
+        )
+    for insee, name, errors in report["invalid"]:
+        print(f"Commune {name} ({insee}) skipped: {errors}")
+
+    Metadata.objects.get_or_create(prop="banatic_communes_year", value=year)
+    source_entry.record_import(
+        sha256, report["rows"], timedelta(seconds=time.monotonic() - start_time)
+    )
 
 
 def import_commune_row_from_banatic(row: dict, year_entry: DataYear) -> None:
@@ -60,7 +124,61 @@ def import_commune_row_from_banatic(row: dict, year_entry: DataYear) -> None:
         raise ValueError(f"Commune {name} ({insee}) not found")
 
 
-def import_epci_data_from_banatic(year: int) -> None:
+def bulk_import_commune_rows_from_banatic(
+    rows: Iterable[dict], year_entry: DataYear
+) -> dict:
+    """
+    Bulk counterpart of import_commune_row_from_banatic: the communes of the year
+    are fetched in one query, updated in memory and saved with bulk_update.
+
+    Returns a report with the number of updated communes and the lists of rows
+    that were not found, had a different name or invalid values.
+    """
+    communes = {c.insee: c for c in Commune.objects.filter(years=year_entry)}
+    pop_col = f"ptot_{year_entry.year}"
+
+    report = {
+        "rows": 0,
+        "updated": 0,
+        "not_found": [],
+        "name_mismatches": [],
+        "invalid": [],
+    }
+    now = timezone.now()
+    to_update = []
+    for row in rows:
+        report["rows"] += 1
+        name = row["nom_com"]
+        insee = row["insee"]
+        commune = communes.get(insee)
+        if commune is None:
+            report["not_found"].append((insee, name))
+            continue
+
+        if commune.name != name:
+            report["name_mismatches"].append((insee, name, str(commune)))
+
+        commune.siren = str(row["siren"])
+        commune.population = row[pop_col]
+        try:
+            commune.clean_fields(exclude=["departement", "epci"])
+        except ValidationError as e:
+            report["invalid"].append((insee, name, e.messages))
+            continue
+        commune.updated_at = now
+        to_update.append(commune)
+
+    Commune.objects.bulk_update(
+        to_update, ["siren", "population", "updated_at"], batch_size=BULK_BATCH_SIZE
+    )
+    report["updated"] = len(to_update)
+
+    return report
+
+
+def import_epci_data_from_banatic(
+    year: int, force: bool = False, from_dir: str = None, file: str = None
+) -> None:
     # Imports the EPCIs and EPCI <=> communes relations
     # Communes must have been imported beforehand from COG
 
@@ -82,26 +200,124 @@ def import_epci_data_from_banatic(year: int) -> None:
 
     year_entry, _year_return_code = DataYear.objects.get_or_create(year=year)
 
+    source_entry, _source_return_code = DataSource.objects.get_or_create(
+        title="Banatic Périmètre des EPCI à fiscalité propre",
+        url=epci_filename,
+        year=year_entry,
+    )
+
+    start_time = time.monotonic()
     print(f"🧮   Parsing spreadsheet {epci_filename}")
 
+    local_path = get_local_path(epci_filename, from_dir, file, EPCI_LOCAL_FILENAME)
+    source_file = open_url(epci_filename, local_path)
+    sha256 = get_file_sha256(source_file)
+    if not force and source_entry.is_unchanged(sha256):
+        source_file.close()
+        print(f"⏭️   {source_entry} unchanged since its last import, skipped.")
+        return
+
     # Despite its .xls extension, it is actually a tsv.
-    tsv_bytes = requests.get(epci_filename).content
-    str_file = StringIO(tsv_bytes.decode("cp1252"), newline="\n")
-    reader = csv.DictReader(str_file, delimiter="\t")
+    with TextIOWrapper(source_file, encoding="cp1252", newline="") as str_file:
+        reader = csv.DictReader(str_file, delimiter="\t")
+        report = bulk_import_epci_rows_from_banatic(reader, year_entry)
+
+    if report["rows"]:
+        print(f"Imported {report['rows']} entries.")
+        print(
+            f"EPCIs: {report['created']} created, {report['updated_year']} "
+            f"updated year, {report['skipped']} skipped."
+        )
+        print(f"{report['communes']} member communes updated.")
+        for siren in report["not_found"]:
+            print(f"Member commune {siren} not found")
 
-    list_reader = list(reader)
+        Metadata.objects.get_or_create(prop="banatic_epci_year", value=year)
+        source_entry.record_import(
+            sha256, report["rows"], timedelta(seconds=time.monotonic() - start_time)
+        )
+    else:
+        raise ValueError("The spreadsheet is empty")
 
-    rows_count = len(list_reader)
 
-    if rows_count:
-        print(f"Importing {rows_count} entries.")
+@transaction.atomic
+def bulk_import_epci_rows_from_banatic(
+    rows: Iterable[dict], year_entry: DataYear
+) -> dict:
+    """
+    Bulk counterpart of import_epci_row_from_banatic: the member rows are grouped
+    by EPCI, then the EPCIs, their year links and the member communes are each
+    written with bulk queries.
+    """
+    # Group the member communes by EPCI
+    epcis = {}
+    rows_count = 0
+    for row in rows:
+        rows_count += 1
+        key = (row["Nom du groupement"], row["Nature juridique"], row["N° SIREN"])
+        epcis.setdefault(key, []).append(row["Siren membre"])
+
+    # Existing EPCIs are matched on the same fields as get_or_create
+    existing = {
+        (e.name, e.epci_type, e.siren): e
+        for e in Epci.objects.filter(siren__in={key[2] for key in epcis})
+    }
+
+    to_create = []
+    for key in epcis:
+        if key not in existing:
+            name, epci_type, siren = key
+            entry = Epci(name=name, epci_type=epci_type, siren=siren)
+            entry.full_clean()
+            entry.create_slug()
+            entry.create_search_name()
+            existing[key] = entry
+            to_create.append(entry)
+    Epci.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+
+    # Link the EPCIs to the year through the M2M table
+    epci_ids = {existing[key].id for key in epcis}
+    through = Epci.years.through
+    linked_ids = set(
+        through.objects.filter(datayear=year_entry, epci_id__in=epci_ids).values_list(
+            "epci_id", flat=True
+        )
+    )
+    new_links = epci_ids - linked_ids
+    through.objects.bulk_create(
+        [through(epci_id=e_id, datayear_id=year_entry.id) for e_id in new_links],
+        batch_size=BULK_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
 
-        for row in list_reader:
-            print(import_epci_row_from_banatic(row, year_entry))
+    # Adds the membership data on the communes entries
+    member_epcis = {
+        member_siren: existing[key].id
+        for key, members in epcis.items()
+        for member_siren in members
+    }
+    now = timezone.now()
+    communes = list(
+        Commune.objects.filter(years=year_entry, siren__in=member_epcis).only(
+            "id", "siren", "epci_id"
+        )
+    )
+    for commune in communes:
+        commune.epci_id = member_epcis[commune.siren]
+        commune.updated_at = now
+    Commune.objects.bulk_update(
+        communes, ["epci", "updated_at"], batch_size=BULK_BATCH_SIZE
+    )
 
-        Metadata.objects.get_or_create(prop="banatic_epci_year", value=year)
-    else:
-        raise ValueError("The spreadsheet is empty")
+    created_ids = {e.id for e in to_create}
+    return {
+        "rows": rows_count,
+        "created": len(created_ids),
+        "updated_year": len(new_links - created_ids),
+        "skipped": len(epci_ids) - len(new_links),
+        "communes": len(communes),
+        "not_found": sorted(set(member_epcis) - {c.siren for c in communes}),
+    }
 
 
 def import_epci_row_from_banatic(row, year_entry) -> str:
@@ -1,9 +1,25 @@
 import re
-
-from francesubdivisions.services.datagouv import get_datagouv_file
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import TextIOWrapper
+from typing import Iterator
+from zipfile import ZipFile
+
+from django.db import transaction
+from django.utils import timezone
+
+from francesubdivisions.services.datagouv import (
+    get_datagouv_file,
+    get_datagouv_manifest,
+)
 from francesubdivisions.services.utils import (
-    get_zip_from_url,
-    parse_csv_from_distant_zip,
+    BULK_BATCH_SIZE,
+    batched,
+    get_file_sha256,
+    get_local_path,
+    iter_csv_from_stream,
+    open_url,
 )
 from francesubdivisions.models import (
     Commune,
@@ -21,10 +37,39 @@ from francesubdivisions.models import (
 COG_ID = "58c984b088ee386cdb1261f3"
 COG_MIN_YEAR = 2019
 
+COG_REGIONS_REGEX = re.compile(r"Millésime (?P<year>\d{4})\s: Liste des régions")
+COG_DEPTS_REGEX = re.compile(r"Millésime (?P<year>\d{4})\s: Liste des départements")
+COG_COMMUNES_REGEX = re.compile(r"^Millésime (?P<year>\d{4})\s:\s+Liste des communes")
+
+
+def get_cog_years(manifest: dict = None, from_dir: str = None) -> list:
+    """
+    Returns the sorted list of the years for which the regions, departements and
+    communes files are all available in the COG dataset
+    """
+    if not manifest:
+        manifest = get_datagouv_manifest(COG_ID, from_dir)
+
+    years = None
+    for regex in [COG_REGIONS_REGEX, COG_DEPTS_REGEX, COG_COMMUNES_REGEX]:
+        level_years = set(
+            get_datagouv_file(COG_ID, regex, COG_MIN_YEAR, manifest=manifest)
+        )
+        years = level_years if years is None else years & level_years
 
-def import_regions_from_cog(year: int = 0) -> dict:
-    region_regex = re.compile(r"Millésime (?P<year>\d{4})\s: Liste des régions")
-    region_files = get_datagouv_file(COG_ID, region_regex, COG_MIN_YEAR)
+    return sorted(years)
+
+
+def import_regions_from_cog(
+    year: int = 0,
+    force: bool = False,
+    from_dir: str = None,
+    file: str = None,
+    manifest: dict = None,
+) -> dict:
+    region_files = get_datagouv_file(
+        COG_ID, COG_REGIONS_REGEX, COG_MIN_YEAR, from_dir, manifest
+    )
 
     if not year:
         year = max(region_files)
@@ -55,20 +100,30 @@ def import_regions_from_cog(year: int = 0) -> dict:
             "nccenr": "nccenr",
         }
 
+    start_time = time.monotonic()
     print(f"🗜️   Parsing archive {import_region_file['url']}")
-    regions = parse_csv_from_distant_zip(
-        import_region_file["url"],
-        get_zip_from_url,
+    with open_cog_rows(
+        source_entry,
         f"region{year}.csv",
         column_names,
-    )
-
-    for region in regions:
-        print(import_region_from_cog(region, year_entry, source_entry))
+        local_path=get_local_path(source_entry.url, from_dir, file),
+        force=force,
+    ) as (regions, sha256):
+        if regions is None:
+            print(f"⏭️   {source_entry} unchanged since its last import, skipped.")
+            return {"year_entry": year_entry, "skipped": True}
+
+        row_count = 0
+        for region in regions:
+            row_count += 1
+            print(import_region_from_cog(region, year_entry, source_entry))
 
     Metadata.objects.get_or_create(prop="cog_regions_year", value=year)
+    source_entry.record_import(
+        sha256, row_count, timedelta(seconds=time.monotonic() - start_time)
+    )
 
-    return {"year_entry": year_entry}
+    return {"year_entry": year_entry, "skipped": False}
 
 
 def import_region_from_cog(
@@ -94,23 +149,24 @@ def import_region_from_cog(
 
     # Import metadata
     metadata_keys = ["seat_insee", "tncc", "nccenr"]
-    for md_key in metadata_keys:
-        metadata_entry, _md_entry_return_code = RegionData.objects.get_or_create(
-            region=entry,
-            year=year_entry,
-            datacode=md_key,
-            datatype="string",
-            value=region[md_key],
-            source=source_entry,
-        )
-        metadata_entry.save()
+    RegionData.objects.upsert(
+        (entry.id, year_entry.id, md_key, region[md_key], "string", source_entry.id)
+        for md_key in metadata_keys
+    )
 
     return return_message
 
 
-def import_departements_from_cog(year):
-    depts_regex = re.compile(r"Millésime (?P<year>\d{4})\s: Liste des départements")
-    depts_files = get_datagouv_file(COG_ID, depts_regex, COG_MIN_YEAR)
+def import_departements_from_cog(
+    year,
+    force: bool = False,
+    from_dir: str = None,
+    file: str = None,
+    manifest: dict = None,
+):
+    depts_files = get_datagouv_file(
+        COG_ID, COG_DEPTS_REGEX, COG_MIN_YEAR, from_dir, manifest
+    )
 
     if not year:
         year = max(depts_files)
@@ -143,20 +199,30 @@ def import_departements_from_cog(year):
             "nccenr": "nccenr",
         }
 
+    start_time = time.monotonic()
     print(f"🗜️   Parsing archive {import_dept_file['url']}")
-    depts = parse_csv_from_distant_zip(
-        import_dept_file["url"],
-        get_zip_from_url,
+    with open_cog_rows(
+        source_entry,
         f"departement{year}.csv",
         column_names,
-    )
-
-    for dept in depts:
-        print(import_departement_from_cog(dept, year_entry, source_entry))
+        local_path=get_local_path(source_entry.url, from_dir, file),
+        force=force,
+    ) as (depts, sha256):
+        if depts is None:
+            print(f"⏭️   {source_entry} unchanged since its last import, skipped.")
+            return {"year_entry": year_entry, "skipped": True}
+
+        row_count = 0
+        for dept in depts:
+            row_count += 1
+            print(import_departement_from_cog(dept, year_entry, source_entry))
 
     Metadata.objects.get_or_create(prop="cog_depts_year", value=year)
+    source_entry.record_import(
+        sha256, row_count, timedelta(seconds=time.monotonic() - start_time)
+    )
 
-    return {"year_entry": year_entry}
+    return {"year_entry": year_entry, "skipped": False}
 
 
 def import_departement_from_cog(
@@ -184,24 +250,25 @@ def import_departement_from_cog(
 
     # Import metadata
     metadata_keys = ["seat_insee", "tncc", "nccenr"]
-    for md_key in metadata_keys:
-        metadata_entry, _md_entry_return_code = DepartementData.objects.get_or_create(
-            departement=entry,
-            year=year_entry,
-            datacode=md_key,
-            datatype="string",
-            value=dept[md_key],
-            source=source_entry,
-        )
-    metadata_entry.save()
+    DepartementData.objects.upsert(
+        (entry.id, year_entry.id, md_key, dept[md_key], "string", source_entry.id)
+        for md_key in metadata_keys
+    )
 
     return return_message
 
 
-def import_communes_from_cog(year):
-
-    communes_regex = re.compile(r"^Millésime (?P<year>\d{4})\s:\s+Liste des communes")
-    communes_files = get_datagouv_file(COG_ID, communes_regex, COG_MIN_YEAR)
+def import_communes_from_cog(
+    year,
+    bulk: bool = True,
+    force: bool = False,
+    from_dir: str = None,
+    file: str = None,
+    manifest: dict = None,
+):
+    communes_files = get_datagouv_file(
+        COG_ID, COG_COMMUNES_REGEX, COG_MIN_YEAR, from_dir, manifest
+    )
 
     if not year:
         year = max(communes_files)
@@ -241,21 +308,80 @@ def import_communes_from_cog(year):
         }
         typecheck = {"column": "typecom", "value": "COM"}
 
+    start_time = time.monotonic()
     print(f"🗜️   Parsing archive {import_communes_file['url']}")
-    communes = parse_csv_from_distant_zip(
-        import_communes_file["url"],
-        get_zip_from_url,
+    with open_cog_rows(
+        source_entry,
         csv_filename,
         column_names,
         typecheck=typecheck,
-    )
-
-    for commune in communes:
-        print(import_commune_from_cog(commune, year_entry, source_entry))
+        local_path=get_local_path(source_entry.url, from_dir, file),
+        force=force,
+    ) as (communes, sha256):
+        if communes is None:
+            print(f"⏭️   {source_entry} unchanged since its last import, skipped.")
+            return {"year_entry": year_entry, "skipped": True}
+
+        row_count = 0
+        if bulk:
+            # The rows are read and written by batches to keep the memory usage flat
+            report = {"created": 0, "updated_year": 0, "skipped": 0}
+            for batch in batched(communes, BULK_BATCH_SIZE):
+                row_count += len(batch)
+                batch_report = bulk_import_communes_from_cog(
+                    batch, year_entry, source_entry
+                )
+                for key in report:
+                    report[key] += batch_report[key]
+            print(
+                f"Communes: {report['created']} created, {report['updated_year']} "
+                f"updated year, {report['skipped']} skipped."
+            )
+        else:
+            for commune in communes:
+                row_count += 1
+                print(import_commune_from_cog(commune, year_entry, source_entry))
 
     md_entry, md_return_code = Metadata.objects.get_or_create(
         prop="cog_communes_year", value=year
     )
+    source_entry.record_import(
+        sha256, row_count, timedelta(seconds=time.monotonic() - start_time)
+    )
+
+    return {"year_entry": year_entry, "skipped": False}
+
+
+@contextmanager
+def open_cog_rows(
+    source_entry: DataSource,
+    csv_name: str,
+    column_names: dict,
+    typecheck: dict = False,
+    local_path: str = None,
+    force: bool = False,
+) -> Iterator[tuple]:
+    """
+    Downloads the source file (or opens its local copy if local_path is provided)
+    and yields an iterator over its parsed rows, along with its SHA-256.
+    The rows are read lazily, until the context is exited.
+
+    If the file is identical to the last one imported from that source, it is
+    not parsed and None is yielded instead of the rows, unless force is set.
+    """
+    with open_url(source_entry.url, local_path) as source_file:
+        sha256 = get_file_sha256(source_file)
+        if not force and source_entry.is_unchanged(sha256):
+            yield None, sha256
+            return
+
+        with ZipFile(source_file) as zip_file, zip_file.open(csv_name) as csv_file:
+            stream = TextIOWrapper(csv_file, encoding="utf-8-sig")
+            keys = list(column_names)
+            yield (
+                dict(zip(keys, values))
+                for values in iter_csv_from_stream(stream, column_names, typecheck)
+            ), sha256
 
 
 def import_commune_from_cog(
@@ -282,15 +408,98 @@ def import_commune_from_cog(
 
     # Import metadata
     metadata_keys = ["tncc", "nccenr"]
-    for md_key in metadata_keys:
-        metadata_entry, _md_entry_return_code = CommuneData.objects.get_or_create(
-            commune=entry,
-            year=year_entry,
-            datacode=md_key,
-            datatype="string",
-            value=commune[md_key],
-            source=source_entry,
-        )
-    metadata_entry.save()
+    CommuneData.objects.upsert(
+        (entry.id, year_entry.id, md_key, commune[md_key], "string", source_entry.id)
+        for md_key in metadata_keys
+    )
 
     return return_message
+
+
+@transaction.atomic
+def bulk_import_communes_from_cog(
+    communes: list, year_entry: DataYear, source_entry: DataSource
+) -> dict:
+    """
+    Bulk counterpart of import_commune_from_cog: the départements of the year
+    are loaded once, the parsed rows are diffed in memory against the existing
+    communes and everything is written with bulk queries.
+    """
+    depts = {
+        d.insee: d.id
+        for d in Departement.objects.filter(years=year_entry).only("insee")
+    }
+
+    # Existing communes are matched on the same fields as get_or_create
+    existing = {
+        (c.name, c.insee, c.departement_id): c
+        for c in Commune.objects.filter(insee__in={c["insee"] for c in communes}).only(
+            "id", "name", "insee", "departement_id", "slug", "search_name"
+        )
+    }
+
+    now = timezone.now()
+    entries = []
+    to_create = []
+    to_update = []
+    for commune in communes:
+        try:
+            dept_id = depts[commune["dept"]]
+        except KeyError:
+            raise ValueError(
+                f"Departement {commune['dept']} not found for year {year_entry}"
+            )
+        key = (commune["name"], commune["insee"], dept_id)
+        entry = existing.get(key)
+        if entry is None:
+            entry = Commune(
+                name=commune["name"], insee=commune["insee"], departement_id=dept_id
+            )
+            # The foreign keys are already resolved, so only the fields are checked
+            entry.clean_fields(exclude=["departement", "epci"])
+            entry.create_slug()
+            entry.create_search_name()
+            existing[key] = entry
+            to_create.append(entry)
+        else:
+            computed = (entry.slug, entry.search_name)
+            entry.create_slug()
+            entry.create_search_name()
+            if (entry.slug, entry.search_name) != computed:
+                entry.updated_at = now
+                to_update.append(entry)
+        entries.append(entry)
+
+    Commune.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+    Commune.objects.bulk_update(
+        to_update, ["slug", "search_name", "updated_at"], batch_size=BULK_BATCH_SIZE
+    )
+
+    # Link the communes to the year through the M2M table
+    through = Commune.years.through
+    linked_ids = set(
+        through.objects.filter(
+            datayear=year_entry, commune_id__in=[e.id for e in entries]
+        ).values_list("commune_id", flat=True)
+    )
+    new_links = {e.id for e in entries} - linked_ids
+    through.objects.bulk_create(
+        [through(commune_id=c_id, datayear_id=year_entry.id) for c_id in new_links],
+        batch_size=BULK_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+    # Import metadata
+    metadata_keys = ["tncc", "nccenr"]
+    CommuneData.objects.upsert(
+        (entry.id, year_entry.id, md_key, commune[md_key], "string", source_entry.id)
+        for commune, entry in zip(communes, entries)
+        for md_key in metadata_keys
+    )
+
+    created_ids = {e.id for e in to_create}
+    return {
+        "created": len(created_ids),
+        "updated_year": len(new_links - created_ids),
+        "skipped": len(entries) - len(new_links),
+    }
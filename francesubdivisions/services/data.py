@@ -0,0 +1,85 @@
+"""
+Values of the data models (RegionData, CommuneData...) of many collectivities,
+datacodes and years at once.
+
+The data points are read in one query, filtered on the collectivity, year and datacode
+covered by the unique constraint of each data model, and arranged in a matrix.
+"""
+
+from django.db.models import Q
+
+from francesubdivisions.models import CommuneData, DepartementData, EpciData, RegionData
+
+# Maximal number of values (codes × years × datacodes) returned in one request
+DATA_MAX_VALUES = 100000
+
+# The data model of each level, and the field compared to the codes of each length
+DATA_LEVELS = {
+    "regions": (RegionData, {2: "insee", 9: "siren"}),
+    "departements": (DepartementData, {2: "insee", 3: "insee", 9: "siren"}),
+    "epcis": (EpciData, {9: "siren"}),
+    "communes": (CommuneData, {5: "insee", 9: "siren"}),
+}
+
+
+def split_values(value: str) -> list:
+    """
+    Returns the distinct items of a comma-separated list, in their order
+    """
+    return list(
+        dict.fromkeys(item.strip() for item in value.split(",") if item.strip())
+    )
+
+
+def get_data_matrix(level: str, codes: list, datacodes: list, years: list) -> dict:
+    """
+    Returns the values of the datacodes for the collectivities and years
+
+    codes: Insee or Siren ids of the collectivities, depending on their length
+    The values are indexed as values[code][year][datacode], in the order of the lists,
+    and are None for the missing data points.
+    """
+    try:
+        model, code_fields = DATA_LEVELS[level]
+    except KeyError:
+        raise ValueError(f"Unknown level {level}")
+
+    if len(codes) * len(years) * len(datacodes) > DATA_MAX_VALUES:
+        raise ValueError(f"More than {DATA_MAX_VALUES} values requested")
+
+    collectivity_field = model.collectivity_field
+    filters = Q(pk__in=[])
+    for length, field in code_fields.items():
+        filters |= Q(
+            **{
+                f"{collectivity_field}__{field}__in": {
+                    code for code in codes if len(code) == length
+                }
+            }
+        )
+
+    fields = list(dict.fromkeys(code_fields.values()))
+    rows = (
+        model.objects.filter(filters, year__year__in=years, datacode__in=datacodes)
+        .values_list(
+            *[f"{collectivity_field}__{field}" for field in fields],
+            "year__year",
+            "datacode",
+            "value",
+        )
+        .order_by()
+    )
+
+    code_index = {code: index for index, code in enumerate(codes)}
+    year_index = {year: index for index, year in enumerate(years)}
+    datacode_index = {datacode: index for index, datacode in enumerate(datacodes)}
+    values = [[[None] * len(datacodes) for _ in years] for _ in codes]
+    for *row_codes, year, datacode, value in rows:
+        # A collectivity can be requested by both its Insee and Siren ids
+        for code in row_codes:
+            if code in code_index:
+                values[code_index[code]][year_index[year]][
+                    datacode_index[datacode]
+                ] = value
+
+    return {"codes": codes, "years": years, "datacodes": datacodes, "values": values}
@@ -0,0 +1,85 @@
+"""
+Global version of the stored data, used as the HTTP validator of the API responses.
+
+The version is the date of the last change, stored as a Metadata entry so that it is
+shared between the processes, and cached for DATA_VERSION_TTL seconds so that most
+requests are answered without a query.
+"""
+
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from francesubdivisions.models import Metadata
+
+DATA_VERSION_PROP = "data_version"
+DATA_VERSION_CACHE_KEY = "francesubdivisions:data_version"
+
+# Delay (in seconds) during which the version is read from the cache
+DATA_VERSION_TTL = 60
+
+
+def get_data_version() -> datetime:
+    """
+    Returns the date of the last change of the data, or None if it is unknown
+    """
+    version = cache.get(DATA_VERSION_CACHE_KEY)
+    if version is None:
+        value = (
+            Metadata.objects.filter(prop=DATA_VERSION_PROP)
+            .values_list("value", flat=True)
+            .first()
+        )
+        if value is None:
+            return None
+        version = datetime.fromisoformat(value)
+        cache.set(DATA_VERSION_CACHE_KEY, version, DATA_VERSION_TTL)
+    return version
+
+
+async def aget_data_version() -> datetime:
+    """
+    Async version of get_data_version
+    """
+    version = await cache.aget(DATA_VERSION_CACHE_KEY)
+    if version is None:
+        value = (
+            await Metadata.objects.filter(prop=DATA_VERSION_PROP)
+            .values_list("value", flat=True)
+            .afirst()
+        )
+        if value is None:
+            return None
+        version = datetime.fromisoformat(value)
+        await cache.aset(DATA_VERSION_CACHE_KEY, version, DATA_VERSION_TTL)
+    return version
+
+
+def bump_data_version() -> datetime:
+    """
+    Records that the data changed, which invalidates the cached responses
+    """
+    version = timezone.now()
+    # update() does not send the post_save signal of Metadata
+    if not Metadata.objects.filter(prop=DATA_VERSION_PROP).update(
+        value=version.isoformat(), updated_at=version
+    ):
+        Metadata.objects.create(prop=DATA_VERSION_PROP, value=version.isoformat())
+    cache.set(DATA_VERSION_CACHE_KEY, version, DATA_VERSION_TTL)
+    return version
+
+
+def data_version_etag(request, *args, **kwargs) -> str:
+    version = get_data_version()
+    if version is None:
+        return None
+    return format_etag(version)
+
+
+def format_etag(version: datetime) -> str:
+    return f"{version.timestamp():.6f}"
+
+
+def data_version_last_modified(request, *args, **kwargs) -> datetime:
+    return get_data_version()
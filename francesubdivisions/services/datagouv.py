@@ -1,17 +1,36 @@
-import requests
+import json
+
+from francesubdivisions.services.utils import get_local_path, open_url
 
 API_BASE = "https://www.data.gouv.fr/api/1/"
 
 
-def get_datagouv_file(dataset_id, title_regex, min_year=0):
+def get_datagouv_manifest(dataset_id: str, from_dir: str = None) -> dict:
+    """
+    Returns the metadata of the dataset from the data.gouv.fr API, or from
+    the copy of the API response saved as <dataset_id>.json in from_dir
+    """
+    dataset_url = f"{API_BASE}datasets/{dataset_id}/"
+    local_path = get_local_path(dataset_url, from_dir, filename=f"{dataset_id}.json")
+
+    with open_url(dataset_url, local_path) as dataset_file:
+        return json.load(dataset_file)
+
+
+def get_datagouv_file(
+    dataset_id, title_regex, min_year=0, from_dir=None, manifest=None
+):
     """
     dataset_id: the id of the dataset
     title_regex: the regex to find the searched file title
     min_year: if the formatting of the file changed over time, the first managed year
+    from_dir: if provided, the dataset manifest is read from that directory
+    manifest: if provided, the already fetched dataset manifest
     """
-    dataset_url = f"{API_BASE}datasets/{dataset_id}/"
-
-    response = requests.get(dataset_url).json()
+    if manifest:
+        response = manifest
+    else:
+        response = get_datagouv_manifest(dataset_id, from_dir)
 
     matching_files = {}
     for r in response["resources"]:
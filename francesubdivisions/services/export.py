@@ -0,0 +1,169 @@
+"""
+Streamed exports of the full tables, in NDJSON or CSV.
+
+The rows are read by chunks with values_list().iterator() (values().aiterator() in the
+async views), so that the export runs in constant memory and its first bytes are sent
+before the last rows are read.
+"""
+
+import csv
+import json
+
+from django.db.models import QuerySet
+from django.http import Http404, StreamingHttpResponse
+
+from francesubdivisions.models import Commune, Departement, Epci, Region
+
+# Number of rows fetched from the database at once
+EXPORT_CHUNK_SIZE = 2000
+
+# The exported columns of each level, with the field they are read from
+EXPORT_COLUMNS = {
+    "regions": {
+        "id": "id",
+        "name": "name",
+        "insee": "insee",
+        "siren": "siren",
+        "category": "category",
+        "slug": "slug",
+    },
+    "departements": {
+        "id": "id",
+        "name": "name",
+        "insee": "insee",
+        "siren": "siren",
+        "category": "category",
+        "slug": "slug",
+        "region_insee": "region__insee",
+    },
+    "epcis": {
+        "id": "id",
+        "name": "name",
+        "siren": "siren",
+        "epci_type": "epci_type",
+        "slug": "slug",
+    },
+    "communes": {
+        "id": "id",
+        "name": "name",
+        "insee": "insee",
+        "siren": "siren",
+        "population": "population",
+        "slug": "slug",
+        "departement_insee": "departement__insee",
+        "epci_siren": "epci__siren",
+    },
+}
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def export_queryset(level: str, year: int = None, departement: str = None) -> QuerySet:
+    """
+    Returns the rows of a level, as tuples of the EXPORT_COLUMNS of the level
+
+    year: only export the entries of that year
+    departement: only export the entries in (or containing) the département
+    with that Insee code
+    """
+    if level == "regions":
+        queryset = Region.objects.all()
+        departement_filter = "departement__insee"
+    elif level == "departements":
+        queryset = Departement.objects.all()
+        departement_filter = "insee"
+    elif level == "epcis":
+        queryset = Epci.objects.all()
+        departement_filter = None
+    elif level == "communes":
+        queryset = Commune.objects.all()
+        departement_filter = "departement__insee"
+    else:
+        raise ValueError(f"Unknown level {level}")
+
+    if year:
+        queryset = queryset.filter(years__year=year)
+    if departement:
+        if departement_filter:
+            queryset = queryset.filter(**{departement_filter: departement})
+        else:
+            # An EPCI can span several départements, it is only listed once
+            queryset = queryset.filter(
+                id__in=Commune.objects.filter(departement__insee=departement).values(
+                    "epci"
+                )
+            )
+
+    return queryset.order_by("id").values_list(*EXPORT_COLUMNS[level].values())
+
+
+class Echo:
+    """
+    File-like object that returns what is written, for csv.writer
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_row_encoder(export_format: str, columns: list):
+    """
+    Returns the header line and the function encoding each row, for a format
+    """
+    if export_format == "ndjson":
+        return None, lambda row: (
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+        )
+    elif export_format == "csv":
+        writer = csv.writer(Echo())
+        return writer.writerow(columns), writer.writerow
+    raise ValueError(f"Unknown format {export_format}")
+
+
+def stream_rows(queryset: QuerySet, export_format: str, columns: list):
+    header, encode = get_row_encoder(export_format, columns)
+    if header:
+        yield header
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield encode(row)
+
+
+async def astream_rows(queryset: QuerySet, export_format: str, columns: list):
+    """
+    Async version of stream_rows, for a values() queryset: its aiterator() fetches
+    the chunks in a thread, unlike the one of values_list() which runs the query
+    in the event loop (as of Django 5.2)
+    """
+    header, encode = get_row_encoder(export_format, columns)
+    if header:
+        yield header
+    async for row in queryset.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield encode(row.values())
+
+
+def export_response(
+    level: str,
+    export_format: str,
+    year: int = None,
+    departement: str = None,
+    is_async: bool = False,
+) -> StreamingHttpResponse:
+    """
+    Returns the streamed export of a level (an async iterator for the ASGI servers)
+    """
+    if level not in EXPORT_COLUMNS or export_format not in EXPORT_FORMATS:
+        raise Http404(f"No export for {level}.{export_format}")
+
+    queryset = export_queryset(level, year, departement)
+    columns = list(EXPORT_COLUMNS[level])
+    if is_async:
+        queryset = queryset.values(*EXPORT_COLUMNS[level].values())
+        rows = astream_rows(queryset, export_format, columns)
+    else:
+        rows = stream_rows(queryset, export_format, columns)
+    response = StreamingHttpResponse(rows, content_type=EXPORT_FORMATS[export_format])
+    response["Content-Disposition"] = f'attachment; filename="{level}.{export_format}"'
+    return response
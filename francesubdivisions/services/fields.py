@@ -0,0 +1,81 @@
+"""
+Sparse fieldsets of the list endpoints.
+
+In flat mode, the entries are read with values() and their relations are returned
+as codes, instead of being loaded and serialized with all their nested relations.
+"""
+
+from django.db.models import F, QuerySet
+
+# The fields available in flat mode, with the field they are read from
+FLAT_FIELDS = {
+    "regions": {
+        "id": "id",
+        "name": "name",
+        "insee": "insee",
+        "siren": "siren",
+    },
+    "departements": {
+        "id": "id",
+        "name": "name",
+        "insee": "insee",
+        "siren": "siren",
+        "region_insee": "region__insee",
+    },
+    "epcis": {
+        "id": "id",
+        "name": "name",
+        "siren": "siren",
+    },
+    "communes": {
+        "id": "id",
+        "name": "name",
+        "insee": "insee",
+        "siren": "siren",
+        "population": "population",
+        "departement_insee": "departement__insee",
+        "epci_siren": "epci__siren",
+    },
+}
+
+
+def parse_fields(level: str, fields: str = None) -> list:
+    """
+    Returns the requested fields of a level (all of them if fields is empty)
+
+    fields: comma-separated names. The id is always returned, as the pages follow it.
+    """
+    available = FLAT_FIELDS[level]
+    if not fields:
+        return list(available)
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(
+            f"Unknown fields {', '.join(unknown)}, "
+            f"allowed values: {', '.join(available)}"
+        )
+    return ["id", *dict.fromkeys(name for name in names if name != "id")]
+
+
+def select_fields(
+    queryset: QuerySet, level: str, fields: str = None, flat: bool = False
+) -> QuerySet:
+    """
+    Returns the queryset unchanged, or the requested flat fields of its entries
+    if fields is set or flat is true
+    """
+    if not fields and not flat:
+        return queryset
+
+    lookups = FLAT_FIELDS[level]
+    names = parse_fields(level, fields)
+    return (
+        queryset.select_related(None)
+        .prefetch_related(None)
+        .values(
+            *[name for name in names if lookups[name] == name],
+            **{name: F(lookups[name]) for name in names if lookups[name] != name},
+        )
+    )
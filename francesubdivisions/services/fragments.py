@@ -0,0 +1,186 @@
+"""
+Pre-serialized regions, départements and EPCIs, nested as-is in the API responses.
+
+The nested entries are the same in many responses (e.g. the département of every
+commune), so each of them is validated once per data version and kept in-process
+as a Fragment, instead of being validated again for every response. When the
+orjson renderer is used, the Fragments are also encoded once, and their JSON is
+spliced in the responses (see renderers.py).
+
+The async views attach the Fragments to their entries beforehand (attach_fragments),
+since the schemas can't query the database from the event loop.
+"""
+
+from threading import RLock
+from typing import Annotated
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from pydantic import WrapSerializer, WrapValidator
+
+from francesubdivisions.models import Commune, Departement, Epci, Region
+
+
+class Fragment:
+    """
+    Serialized entry: its payload, and its JSON encoding computed on first use
+    """
+
+    __slots__ = ("payload", "_json")
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self._json = None
+
+    @property
+    def json(self) -> bytes:
+        if self._json is None:
+            from francesubdivisions.renderers import dumps
+
+            self._json = dumps(self.payload)
+        return self._json
+
+
+def json_fragments_enabled() -> bool:
+    """
+    The Fragments can only be left in the serialized data for the orjson renderer
+    """
+    return getattr(settings, "FRANCESUBDIVISIONS_JSON_FRAGMENTS", False)
+
+
+def validate_fragment(value, handler):
+    if isinstance(value, Fragment):
+        return value
+    return handler(value)
+
+
+def serialize_fragment(value, handler, info):
+    if not isinstance(value, Fragment):
+        return handler(value)
+    if (info.context or {}).get("json_fragments", json_fragments_enabled()):
+        return value
+    return value.payload
+
+
+class Prerendered:
+    """
+    Annotation of a nested schema, that also accepts the Fragments as-is
+    """
+
+    def __class_getitem__(cls, schema):
+        return Annotated[
+            schema,
+            WrapValidator(validate_fragment),
+            WrapSerializer(serialize_fragment),
+        ]
+
+
+# The Fragments nested in the entries of each model: their level and id field
+NESTED_FRAGMENTS = {
+    Departement: [("regions", "region_id")],
+    Commune: [("departements", "departement_id"), ("epcis", "epci_id")],
+}
+
+_fragments = {}
+_fragments_lock = RLock()
+_fragments_version = None
+
+
+def get_fragment(level: str, entry_id: int) -> Fragment:
+    """
+    Returns the Fragment of an entry (None if entry_id is None)
+    """
+    if entry_id is None:
+        return None
+
+    fragment = get_fragments(level).get(entry_id)
+    if fragment is None:
+        # The entry was created by another process since the Fragments were built
+        clear_fragments()
+        fragment = get_fragments(level).get(entry_id)
+    return fragment
+
+
+def get_fragments(level: str) -> dict:
+    """
+    Returns the Fragments of all the entries of a level, by id, building them if needed
+    """
+    with _fragments_lock:
+        if level not in _fragments:
+            _fragments[level] = build_fragments(level)
+        return _fragments[level]
+
+
+def build_fragments(level: str) -> dict:
+    from francesubdivisions.schemas import DepartementSchema, EpciSchema, RegionSchema
+
+    if level == "regions":
+        queryset = Region.objects.prefetch_related("years")
+        schema = RegionSchema
+    elif level == "departements":
+        queryset = Departement.objects.prefetch_related("years")
+        schema = DepartementSchema
+    elif level == "epcis":
+        queryset = Epci.objects.prefetch_related("years")
+        schema = EpciSchema
+    else:
+        raise ValueError(f"Unknown level {level}")
+
+    # The nested Fragments are serialized as their payload
+    return {
+        entry.id: Fragment(
+            schema.from_orm(entry).model_dump(context={"json_fragments": False})
+        )
+        for entry in queryset
+    }
+
+
+def get_nested_fragment(obj, level: str, entry_id: int) -> Fragment:
+    """
+    Returns the Fragment nested in an entry, from those attached to it if any
+    """
+    attached = getattr(obj, "nested_fragments", None)
+    if attached is not None:
+        return attached[level]
+    return get_fragment(level, entry_id)
+
+
+def attach_fragments(items: list) -> None:
+    """
+    Attaches the Fragments nested in the entries to them, so that they are serialized
+    without a lookup (which could rebuild the Fragments)
+    """
+    for item in items:
+        relations = NESTED_FRAGMENTS.get(type(item))
+        if relations:
+            item.nested_fragments = {
+                level: get_fragment(level, getattr(item, field))
+                for level, field in relations
+            }
+
+
+async def aattach_fragments(items: list) -> None:
+    """
+    Async version of attach_fragments, the missing Fragments being built in a thread
+    """
+    await sync_to_async(attach_fragments)(items)
+
+
+def check_fragments(version) -> None:
+    """
+    Drops the Fragments if they were built for another data version
+    """
+    global _fragments_version
+
+    if version != _fragments_version:
+        with _fragments_lock:
+            _fragments.clear()
+            _fragments_version = version
+
+
+def clear_fragments() -> None:
+    """
+    Drops all the Fragments, so that they are rebuilt on their next use
+    """
+    with _fragments_lock:
+        _fragments.clear()
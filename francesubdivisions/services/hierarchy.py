@@ -0,0 +1,168 @@
+"""
+Snapshot of the whole region → département → EPCI → commune tree of a year.
+
+The tree is assembled from four flat queries, and stored as JSON (and gzip) bytes in
+the response cache for the data version, since it is the same for all the clients.
+"""
+
+import json
+import re
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+from django.utils.text import compress_string
+
+from francesubdivisions.models import Commune, DataYear, Departement, Epci, Region
+from francesubdivisions.services.data_version import format_etag, get_data_version
+from francesubdivisions.services.response_cache import (
+    RESPONSE_CACHE_PREFIX,
+    get_response_cache,
+    get_timeout,
+)
+
+# Same check as the GZipMiddleware of Django
+re_accepts_gzip = re.compile(r"\bgzip\b")
+
+
+def build_hierarchy(year_entry: DataYear) -> dict:
+    """
+    Returns the tree of the entries of a year
+
+    The communes without EPCI are listed in their département along the EPCIs,
+    and the départements without region after the regions.
+    """
+    regions = {
+        region_id: {"insee": insee, "siren": siren, "name": name, "departements": []}
+        for region_id, insee, siren, name in Region.objects.filter(years=year_entry)
+        .order_by("insee")
+        .values_list("id", "insee", "siren", "name")
+    }
+
+    departements = {}
+    orphan_departements = []
+    for departement_id, insee, siren, name, region_id in (
+        Departement.objects.filter(years=year_entry)
+        .order_by("insee")
+        .values_list("id", "insee", "siren", "name", "region_id")
+    ):
+        departement = {
+            "insee": insee,
+            "siren": siren,
+            "name": name,
+            "epcis": [],
+            "communes": [],
+        }
+        departements[departement_id] = departement
+        if region_id in regions:
+            regions[region_id]["departements"].append(departement)
+        else:
+            orphan_departements.append(departement)
+
+    # The EPCIs are linked to the communes, whatever their years
+    epcis = {
+        epci_id: (siren, name)
+        for epci_id, siren, name in Epci.objects.order_by("name").values_list(
+            "id", "siren", "name"
+        )
+    }
+    epci_order = {epci_id: index for index, epci_id in enumerate(epcis)}
+
+    # The EPCIs of each département, with their communes in that département
+    departement_epcis = {}
+    for insee, siren, name, population, departement_id, epci_id in (
+        Commune.objects.filter(years=year_entry)
+        .order_by("insee")
+        .values_list(
+            "insee", "siren", "name", "population", "departement_id", "epci_id"
+        )
+    ):
+        departement = departements.get(departement_id)
+        if departement is None:
+            continue
+
+        commune = {
+            "insee": insee,
+            "siren": siren,
+            "name": name,
+            "population": population,
+        }
+        if epci_id not in epcis:
+            departement["communes"].append(commune)
+            continue
+
+        key = (departement_id, epci_id)
+        if key not in departement_epcis:
+            epci_siren, epci_name = epcis[epci_id]
+            departement_epcis[key] = {
+                "siren": epci_siren,
+                "name": epci_name,
+                "communes": [],
+            }
+        departement_epcis[key]["communes"].append(commune)
+
+    for (departement_id, epci_id), epci in sorted(
+        departement_epcis.items(), key=lambda item: epci_order[item[0][1]]
+    ):
+        departements[departement_id]["epcis"].append(epci)
+
+    return {
+        "year": year_entry.year,
+        "regions": list(regions.values()),
+        "departements": orphan_departements,
+    }
+
+
+def get_hierarchy_content(year_entry: DataYear) -> tuple:
+    """
+    Returns the JSON of the tree of a year, its gzip compression (or None),
+    and the ETag of the data version (or None)
+    """
+    version = get_data_version()
+    if version is None:
+        return *build_hierarchy_content(year_entry), None
+
+    etag = format_etag(version)
+    cache = get_response_cache()
+    key = f"{RESPONSE_CACHE_PREFIX}:{etag}:hierarchy:{year_entry.year}"
+    cached = cache.get(key)
+    if cached is None:
+        cached = build_hierarchy_content(year_entry)
+        cache.set(key, cached, get_timeout())
+    return *cached, quote_etag(etag)
+
+
+def build_hierarchy_content(year_entry: DataYear) -> tuple:
+    content = json.dumps(
+        build_hierarchy(year_entry), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+    compressed = compress_string(content) if hierarchy_gzip_enabled() else None
+    return content, compressed
+
+
+def hierarchy_gzip_enabled() -> bool:
+    return getattr(settings, "FRANCESUBDIVISIONS_HIERARCHY_GZIP", True)
+
+
+def hierarchy_response(
+    request, content: bytes, compressed: bytes, etag: str = None
+) -> HttpResponse:
+    """
+    Returns the compressed tree to the clients that accept it
+
+    The compressed tree gets a weak ETag, as with the GZipMiddleware of Django, since
+    the two encodings can't share a strong one.
+    """
+    accepts_gzip = re_accepts_gzip.search(request.headers.get("Accept-Encoding", ""))
+    if compressed is not None and accepts_gzip:
+        response = HttpResponse(compressed, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+        if etag:
+            response["ETag"] = f"W/{etag}"
+    else:
+        response = HttpResponse(content, content_type="application/json")
+        if etag:
+            response["ETag"] = etag
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -0,0 +1,75 @@
+"""
+Cursor pagination for the list endpoints.
+"""
+
+from typing import Any, List, Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+from ninja import Field, Schema
+from ninja.pagination import AsyncPaginationBase
+
+# Default and maximal number of items per page, unless set in the Django settings
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGE_SIZE = 1000
+
+
+class KeysetPagination(AsyncPaginationBase):
+    """
+    Keyset pagination on the id: a page starts after the last id of the previous one,
+    so that all the pages are fetched in constant time, unlike with an offset
+    """
+
+    class Input(Schema):
+        cursor: Optional[int] = Field(
+            None, ge=0, description="next_cursor of the previous page"
+        )
+        page_size: Optional[int] = Field(None, ge=1)
+
+    class Output(Schema):
+        items: List[Any]
+        next_cursor: Optional[int] = None
+
+    def get_page_size(self, requested_page_size: int = None) -> int:
+        page_size = getattr(settings, "FRANCESUBDIVISIONS_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+        max_page_size = getattr(
+            settings, "FRANCESUBDIVISIONS_MAX_PAGE_SIZE", DEFAULT_MAX_PAGE_SIZE
+        )
+        if requested_page_size is None:
+            return page_size
+        return min(requested_page_size, max_page_size)
+
+    def paginate_queryset(
+        self, queryset: QuerySet, pagination: Input, request, **params: Any
+    ) -> dict:
+        page_size = self.get_page_size(pagination.page_size)
+        items = list(self.get_page_queryset(queryset, pagination, page_size))
+        return self.get_page(items, page_size)
+
+    async def apaginate_queryset(
+        self, queryset: QuerySet, pagination: Input, request, **params: Any
+    ) -> dict:
+        page_size = self.get_page_size(pagination.page_size)
+        queryset = self.get_page_queryset(queryset, pagination, page_size)
+        items = [item async for item in queryset]
+        return self.get_page(items, page_size)
+
+    def get_page_queryset(
+        self, queryset: QuerySet, pagination: Input, page_size: int
+    ) -> QuerySet:
+        if pagination.cursor is not None:
+            queryset = queryset.filter(id__gt=pagination.cursor)
+
+        # One more item is fetched to know if there is a next page
+        return queryset.order_by("id")[: page_size + 1]
+
+    def get_page(self, items: list, page_size: int) -> dict:
+        if len(items) > page_size:
+            items = items[:page_size]
+            # The items are dicts when the queryset was trimmed with values()
+            last = items[-1]
+            next_cursor = last["id"] if isinstance(last, dict) else last.id
+        else:
+            next_cursor = None
+
+        return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,126 @@
+"""
+Server-side cache of the API responses.
+
+The responses are stored as rendered bytes in Django's cache framework, under a key
+made of the data version and the request path and parameters, so that a new version
+makes the previous entries unreachable. They are then evicted by the cache backend
+(e.g. the least recently used first, beyond the MAX_ENTRIES of a locmem cache).
+"""
+
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from francesubdivisions.services.data_version import (
+    aget_data_version,
+    format_etag,
+    get_data_version,
+)
+from francesubdivisions.services.fragments import check_fragments
+
+RESPONSE_CACHE_PREFIX = "francesubdivisions:response"
+
+
+def get_response_cache():
+    return caches[getattr(settings, "FRANCESUBDIVISIONS_RESPONSE_CACHE", "default")]
+
+
+def get_response_cache_key(request, version) -> str:
+    params = urlencode(sorted(request.GET.lists()), doseq=True)
+    request_hash = hashlib.sha256(f"{request.path}?{params}".encode()).hexdigest()
+    return f"{RESPONSE_CACHE_PREFIX}:{format_etag(version)}:{request_hash}"
+
+
+def cache_response(run):
+    """
+    Decorator for the operations, serving the GET requests from the cache
+    """
+
+    @wraps(run)
+    def inner(request, *args, **kwargs):
+        version = get_data_version()
+        # The Fragments nested in the responses are built for the same version
+        check_fragments(version)
+        if request.method != "GET" or version is None:
+            return run(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = get_response_cache_key(request, version)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = run(request, *args, **kwargs)
+        if is_cacheable(response):
+            cache.set(key, (response.content, response["Content-Type"]), get_timeout())
+        return response
+
+    return inner
+
+
+def acache_response(run):
+    """
+    Async version of cache_response, which also answers the conditional requests
+    as the condition decorator of the sync router does (it can't await the version)
+    """
+
+    @wraps(run)
+    async def inner(request, *args, **kwargs):
+        version = await aget_data_version()
+        check_fragments(version)
+        if version is None:
+            return await run(request, *args, **kwargs)
+
+        etag = quote_etag(format_etag(version))
+        last_modified = int(version.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = await acached_response(run, request, version, *args, **kwargs)
+
+        if request.method in ("GET", "HEAD"):
+            response.headers.setdefault("ETag", etag)
+            response.headers.setdefault("Last-Modified", http_date(last_modified))
+        return response
+
+    return inner
+
+
+async def acached_response(run, request, version, *args, **kwargs):
+    if request.method != "GET":
+        return await run(request, *args, **kwargs)
+
+    cache = get_response_cache()
+    key = get_response_cache_key(request, version)
+    cached = await cache.aget(key)
+    if cached is not None:
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    response = await run(request, *args, **kwargs)
+    if is_cacheable(response):
+        await cache.aset(
+            key, (response.content, response["Content-Type"]), get_timeout()
+        )
+    return response
+
+
+def is_cacheable(response: HttpResponse) -> bool:
+    # The key doesn't hold the request headers that a Vary header refers to
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.has_header("Vary")
+    )
+
+
+def get_timeout() -> int:
+    return getattr(settings, "FRANCESUBDIVISIONS_RESPONSE_CACHE_TIMEOUT", None)
@@ -0,0 +1,117 @@
+"""
+Search of the subdivisions by name, shared by the sync and async APIs.
+"""
+
+from django.db.models import Q, QuerySet
+
+from francesubdivisions.models import Commune, Departement, Epci, Region
+from francesubdivisions.services.autocomplete import (
+    SHORTNAMED_COMMUNES,
+    commune_item,
+    departement_item,
+    epci_item,
+    get_search_index,
+    rank_queryset,
+    region_item,
+    search_index_enabled,
+    word_start_filter,
+)
+
+# The levels, in the order of the response groups
+SEARCH_LEVELS = ["regions", "departements", "epcis", "communes"]
+
+GROUP_NAMES = {
+    "regions": "Régions",
+    "departements": "Départements",
+    "epcis": "Intercommunalités",
+    "communes": "Communes",
+}
+
+ITEM_BUILDERS = {
+    "regions": region_item,
+    "departements": departement_item,
+    "epcis": epci_item,
+    "communes": commune_item,
+}
+
+# Default maximal number of search results in each category
+SEARCH_PER_GROUP_LIMIT = 20
+
+
+def get_search_levels(category: str = None) -> list:
+    if category in SEARCH_LEVELS:
+        return [category]
+    # If any other value is specified, we'll treat it the same as "all"
+    return SEARCH_LEVELS
+
+
+def search_in_index(level: str, query: str, year: int, limit: int = None) -> list:
+    """
+    Searches in the in-process index (the query is normalized): the EPCIs match
+    anywhere in their name, the other levels at the start of their name
+    or of one of its words
+    """
+    if len(query) < 3:
+        if level == "communes" and query in SHORTNAMED_COMMUNES:
+            return get_search_index(level, year).exact(query, limit)
+        return []
+
+    if level == "epcis":
+        return get_search_index(level, year).contains(query, limit)
+    return get_search_index(level, year).word_startswith(query, limit)
+
+
+def search_queryset(level: str, query: str, year_entry) -> QuerySet:
+    """
+    Returns the matches in the database, ordered by relevance
+    (or None if the query is too short for that level)
+    """
+    # The start of the name or of one of its words
+    word_prefix = Q(search_name__startswith=query) | word_start_filter(query)
+    if len(query) < 3:
+        if level == "communes" and query in SHORTNAMED_COMMUNES:
+            queryset = Commune.objects.filter(search_name=query)
+        else:
+            return None
+    elif level == "regions":
+        # Exclude Mayotte that has no region-level Siren
+        queryset = Region.objects.filter(word_prefix).exclude(siren__exact="")
+    elif level == "departements":
+        # Exclude Haute-Corse, Corse-du-Sud, Martinique and Guyane that have no departement-level Siren
+        queryset = Departement.objects.filter(word_prefix).exclude(siren__exact="")
+    elif level == "epcis":
+        queryset = Epci.objects.filter(search_name__contains=query)
+    else:
+        queryset = Commune.objects.filter(word_prefix)
+
+    return rank_queryset(queryset.filter(years__exact=year_entry), query)
+
+
+def search_level(level: str, query: str, year_entry, limit: int) -> list:
+    """
+    Returns the top results of a level, from the in-process index if it is enabled,
+    else from the database (only fetching the top rows)
+    """
+    if search_index_enabled():
+        return search_in_index(level, query, year_entry.year, limit)
+
+    queryset = search_queryset(level, query, year_entry)
+    if queryset is None:
+        return []
+    return [ITEM_BUILDERS[level](entry) for entry in queryset[:limit]]
+
+
+def build_search_response(results: dict, limit: int = None) -> list:
+    """
+    results: the items found for each level
+    limit: the maximal number of items, filled in the order of the groups
+    """
+    response = []
+    for level in SEARCH_LEVELS:
+        items = results.get(level, [])
+        if limit is not None:
+            items = items[:limit]
+            limit -= len(items)
+        if len(items):
+            response.append({"groupName": GROUP_NAMES[level], "items": items})
+    return response
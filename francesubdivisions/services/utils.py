@@ -1,8 +1,28 @@
 import csv
-from typing import Callable
+import hashlib
+import json
+import os
+from argparse import ArgumentTypeError
+from http import HTTPStatus
+from itertools import islice
+from operator import itemgetter
+from typing import BinaryIO, Callable, Iterable, Iterator
 import requests
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from urllib.parse import urlparse
 from zipfile import ZipFile
-from io import BytesIO, TextIOWrapper
+from io import TextIOWrapper
+
+from django.conf import settings
+from unidecode import unidecode
+
+# Number of rows sent in each query by the bulk importers
+BULK_BATCH_SIZE = 1000
+
+# Downloads are read by chunks and kept in memory up to SPOOL_MAX_SIZE,
+# beyond which they are rolled over to a temporary file on disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
 
 
 def parse_csv_from_distant_zip(
@@ -13,9 +33,18 @@ def parse_csv_from_distant_zip(
     typecheck: dict = False,
 ) -> list:
     with get_zip_method(zip_url) as zip_file:
-        with zip_file.open(csv_name) as csv_file:
-            stream = TextIOWrapper(csv_file, encoding="utf-8-sig")
-            return parse_csv_from_stream(stream, column_names, typecheck)
+        return parse_csv_from_zip(zip_file, csv_name, column_names, typecheck)
+
+
+def parse_csv_from_zip(
+    zip_file: ZipFile,
+    csv_name: str,
+    column_names: dict,
+    typecheck: dict = False,
+) -> list:
+    with zip_file.open(csv_name) as csv_file:
+        stream = TextIOWrapper(csv_file, encoding="utf-8-sig")
+        return parse_csv_from_stream(stream, column_names, typecheck)
 
 
 def parse_csv_from_stream(
@@ -23,22 +52,84 @@ def parse_csv_from_stream(
     column_names: dict,
     typecheck: dict = False,
 ):
-    reader = csv.DictReader(stream)
-    entries = []
+    keys = list(column_names)
+    return [
+        dict(zip(keys, values))
+        for values in iter_csv_from_stream(stream, column_names, typecheck)
+    ]
+
+
+def iter_csv_from_stream(
+    stream,
+    column_names: dict,
+    typecheck: dict = False,
+) -> Iterator[tuple]:
+    """
+    Lazily parses the csv stream, yielding for each row a tuple of the values
+    of the columns in column_names, in the order of its keys.
+
+    The header is read once to find the indices of the columns, so only
+    the needed values are extracted from each row. Blank lines are skipped.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    indices = [header.index(val) for val in column_names.values()]
+    if len(indices) == 1:
+        get_values = lambda row: (row[indices[0]],)
+    else:
+        get_values = itemgetter(*indices)
+
     if typecheck:
-        tc_col = typecheck["column"]
+        tc_index = header.index(typecheck["column"])
         tc_val = typecheck["value"]
-
-    for row in reader:
-        if typecheck:
-            if row[tc_col] != tc_val:
+        for row in reader:
+            if not row:
                 continue
-        entry = {}
-        # Parse all the columns
-        for key, val in column_names.items():
-            entry[key] = row[val]
-        entries.append(entry)
-    return entries
+            if row[tc_index] == tc_val:
+                yield get_values(row)
+    else:
+        for row in reader:
+            if not row:
+                continue
+            yield get_values(row)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Splits the iterable in lists of (at most) size items
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def parse_years(value: str) -> list:
+    """
+    Parses a list of years given as a range (2019-2021)
+    or as comma-separated values (2019,2021)
+    """
+    try:
+        if "-" in value:
+            first_year, last_year = (int(y) for y in value.split("-"))
+            years = list(range(first_year, last_year + 1))
+        else:
+            years = sorted(int(y) for y in value.split(","))
+    except ValueError:
+        raise ArgumentTypeError(f"{value} is not a valid list of years")
+
+    if not years:
+        raise ArgumentTypeError(f"{value} is an empty range of years")
+    return years
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a name for the search (no accents, lowercase)
+    """
+    return unidecode(name).lower()
 
 
 def add_sirens_and_categories(input_file, model_name, year_entry):
@@ -67,7 +158,150 @@ def file_exists_at_url(url: str) -> bool:
     return r.status_code == requests.codes.ok
 
 
+def download_to_tempfile(url: str) -> SpooledTemporaryFile:
+    """
+    Streams the file at the given url into a spooled temporary file,
+    so that the memory usage does not depend on the size of the file.
+    """
+    temp_file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            temp_file.write(chunk)
+    temp_file.seek(0)
+    return temp_file
+
+
+def open_url(url: str, local_path: str = None) -> BinaryIO:
+    """
+    Opens the file at the given url, or its local copy if local_path is provided.
+
+    Downloads go through the download cache if the
+    FRANCESUBDIVISIONS_DOWNLOAD_CACHE_DIR setting is defined.
+    """
+    cache_dir = getattr(settings, "FRANCESUBDIVISIONS_DOWNLOAD_CACHE_DIR", None)
+    if local_path:
+        return open(local_path, "rb")
+    elif cache_dir:
+        return open_cached_url(url, cache_dir)
+    else:
+        return download_to_tempfile(url)
+
+
+def open_cached_url(url: str, cache_dir: str) -> BinaryIO:
+    """
+    Opens the local copy of the file at the given url, after revalidating it
+    with the ETag/Last-Modified headers stored during the previous download.
+
+    The files are stored under their SHA-256 in cache_dir/files, and the
+    metadata of each url in cache_dir/urls.
+    """
+    files_dir = os.path.join(cache_dir, "files")
+    urls_dir = os.path.join(cache_dir, "urls")
+    os.makedirs(files_dir, exist_ok=True)
+    os.makedirs(urls_dir, exist_ok=True)
+
+    url_key = hashlib.sha256(url.encode()).hexdigest()
+    entry_path = os.path.join(urls_dir, f"{url_key}.json")
+    entry = get_download_cache_entry(url, cache_dir)
+
+    headers = {}
+    if entry:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    with requests.get(url, headers=headers, stream=True) as r:
+        if entry and r.status_code == HTTPStatus.NOT_MODIFIED:
+            return open(os.path.join(files_dir, entry["sha256"]), "rb")
+
+        r.raise_for_status()
+        sha256 = hashlib.sha256()
+        temp_file = NamedTemporaryFile(dir=files_dir, delete=False)
+        try:
+            with temp_file:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    temp_file.write(chunk)
+        except BaseException:
+            # The partial download (e.g. of an interrupted import) is not kept
+            os.unlink(temp_file.name)
+            raise
+        file_path = os.path.join(files_dir, sha256.hexdigest())
+        os.replace(temp_file.name, file_path)
+
+        previous_entry = entry
+        entry = {
+            "url": url,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "sha256": sha256.hexdigest(),
+        }
+        with open(entry_path, "w") as entry_file:
+            json.dump(entry, entry_file)
+
+        # The previous version of the file is replaced by the new one
+        if previous_entry and previous_entry["sha256"] != entry["sha256"]:
+            try:
+                os.remove(os.path.join(files_dir, previous_entry["sha256"]))
+            except FileNotFoundError:
+                pass
+
+    return open(file_path, "rb")
+
+
+def get_download_cache_entry(url: str, cache_dir: str) -> dict:
+    """
+    Returns the cache metadata of the given url, or None if it is not cached
+    """
+    url_key = hashlib.sha256(url.encode()).hexdigest()
+    entry_path = os.path.join(cache_dir, "urls", f"{url_key}.json")
+    try:
+        with open(entry_path) as entry_file:
+            entry = json.load(entry_file)
+    except (OSError, ValueError):
+        return None
+
+    # The file itself may have been removed from the cache
+    if not os.path.exists(os.path.join(cache_dir, "files", entry["sha256"])):
+        return None
+
+    return entry
+
+
+def get_local_path(
+    url: str, from_dir: str = None, file: str = None, filename: str = None
+) -> str:
+    """
+    Returns the path of the local copy of the file at the given url:
+    - file, if provided
+    - else the file in from_dir named filename, or by default after the last
+    segment of the url (as a browser would name it)
+    - else None, meaning that the file has to be downloaded
+    """
+    if file:
+        return file
+    elif from_dir:
+        if not filename:
+            filename = os.path.basename(urlparse(url).path)
+        return os.path.join(from_dir, filename)
+    else:
+        return None
+
+
+def get_file_sha256(file: BinaryIO) -> str:
+    """
+    Returns the SHA-256 of the file content, and rewinds it for further reading
+    """
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b""):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
 def get_zip_from_url(zip_url: str) -> ZipFile:
-    zip_name = requests.get(zip_url).content
-    zip_file = ZipFile(BytesIO(zip_name))
+    zip_file = ZipFile(open_url(zip_url))
     return zip_file
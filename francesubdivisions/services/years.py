@@ -0,0 +1,76 @@
+"""
+Resolves the current millésime (DataYear) of each level.
+
+The current year of a level is the highest year stored in its Metadata entry,
+cached in-process. The cache is cleared when Metadata is written (see signals.py),
+and expires after CURRENT_YEAR_TTL seconds for the imports run in another process.
+"""
+
+import time
+from threading import Lock
+
+from django.db.models import IntegerField, QuerySet
+from django.db.models.functions import Cast
+
+from francesubdivisions.models import DataYear, Metadata
+
+# The Metadata prop holding the imported years of each level
+LEVEL_METADATA_PROPS = {
+    "regions": "cog_regions_year",
+    "departements": "cog_depts_year",
+    "epcis": "banatic_epci_year",
+    "communes": "cog_communes_year",
+}
+
+# Delay (in seconds) after which a cached year is resolved again
+CURRENT_YEAR_TTL = 60
+
+_current_years = {}
+_current_years_lock = Lock()
+
+
+def get_current_year(level: str) -> DataYear:
+    """
+    Returns the most recent DataYear imported for the given level
+    """
+    queryset = current_year_queryset(level)
+    with _current_years_lock:
+        year_entry = get_cached_year(level)
+        if year_entry is None:
+            year_entry = queryset.first()
+            set_cached_year(level, year_entry)
+        return year_entry
+
+
+def current_year_queryset(level: str) -> QuerySet:
+    try:
+        prop = LEVEL_METADATA_PROPS[level]
+    except KeyError:
+        raise ValueError(f"Unknown level {level}")
+
+    # The values are cast to compare the years as integers, not as strings
+    years = Metadata.objects.filter(prop=prop).annotate(
+        year=Cast("value", IntegerField())
+    )
+    return DataYear.objects.filter(year__in=years.values("year")).order_by("-year")
+
+
+def get_cached_year(level: str) -> DataYear:
+    cached = _current_years.get(level)
+    if cached and time.monotonic() - cached[1] < CURRENT_YEAR_TTL:
+        return cached[0]
+    return None
+
+
+def set_cached_year(level: str, year_entry: DataYear) -> None:
+    if year_entry is None:
+        raise DataYear.DoesNotExist(f"No year imported for {level}")
+    _current_years[level] = (year_entry, time.monotonic())
+
+
+def clear_current_years() -> None:
+    """
+    Drops the cached years, so that they are resolved again on their next use
+    """
+    with _current_years_lock:
+        _current_years.clear()
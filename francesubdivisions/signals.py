@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from francesubdivisions.models import (
+    Commune,
+    CommuneData,
+    DataSource,
+    DataYear,
+    Departement,
+    DepartementData,
+    Epci,
+    EpciData,
+    Metadata,
+    Region,
+    RegionData,
+)
+from francesubdivisions.services.data_version import bump_data_version
+from francesubdivisions.services.years import clear_current_years
+
+# The models whose changes are visible in the API responses
+VERSIONED_MODELS = [
+    DataYear,
+    DataSource,
+    Region,
+    Departement,
+    Epci,
+    Commune,
+    RegionData,
+    DepartementData,
+    EpciData,
+    CommuneData,
+]
+
+
+@receiver(post_save, sender=Metadata)
+@receiver(post_delete, sender=Metadata)
+def metadata_changed(sender, **kwargs):
+    """
+    The importers write the imported years in Metadata
+    """
+    clear_current_years()
+
+
+def data_changed(sender, using=None, **kwargs):
+    """
+    The bulk imports don't send signals, but they end by saving their DataSource
+
+    The version is bumped once the change is committed, so that the responses rendered
+    meanwhile from the previous data are not cached for the new version, and only
+    once per transaction, however many rows it changes.
+    """
+    if not bump_pending(using):
+        transaction.on_commit(DataVersionBump(), using=using)
+
+
+class DataVersionBump:
+    """
+    The on commit callback bumping the data version, marked as done once it ran
+    (captureOnCommitCallbacks runs the callbacks without removing them)
+    """
+
+    def __init__(self):
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        bump_data_version()
+
+
+def bump_pending(using=None) -> bool:
+    """
+    Whether the current transaction already bumps the version on commit
+    (the callbacks of a rolled back transaction or savepoint are discarded)
+    """
+    connection = transaction.get_connection(using)
+    return any(
+        isinstance(func, DataVersionBump) and not func.done
+        for _sids, func, _robust in connection.run_on_commit
+    )
+
+
+def years_changed(sender, action, using=None, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        data_changed(sender, using=using)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(data_changed, sender=model)
+    post_delete.connect(data_changed, sender=model)
+
+for model in [Region, Departement, Epci, Commune]:
+    m2m_changed.connect(years_changed, sender=model.years.through)
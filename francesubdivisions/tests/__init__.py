@@ -1,6 +1,18 @@
+from .tests_api import *
+from .tests_async_api import *
 from .tests_models import *
+from .tests_renderers import *
 
+from .services.tests_autocomplete import *
 from .services.tests_banatic import *
 from .services.tests_cog import *
+from .services.tests_data import *
+from .services.tests_data_version import *
+from .services.tests_datagouv import *
+from .services.tests_export import *
+from .services.tests_fields import *
+from .services.tests_fragments import *
+from .services.tests_hierarchy import *
 from .services.tests_utils import *
 from .services.tests_validators import *
+from .services.tests_years import *
@@ -0,0 +1,131 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from francesubdivisions.models import Commune, DataSource, DataYear, Departement, Epci
+from francesubdivisions.services.autocomplete import (
+    SearchIndex,
+    clear_search_indexes,
+    get_search_index,
+)
+
+
+class SearchIndexTestCase(TestCase):
+    def setUp(self) -> None:
+        self.index = SearchIndex(
+            [
+                ("Saint-Étienne", {"text": "Saint-Étienne"}, None),
+                ("Sainte-Anne", {"text": "Sainte-Anne"}, None),
+                ("Sada", {"text": "Sada"}, None),
+                ("Y", {"text": "Y"}, None),
+            ]
+        )
+
+    def test_prefix_query_is_accent_insensitive(self) -> None:
+        self.assertEqual(self.index.startswith("saint-e"), [{"text": "Saint-Étienne"}])
+
+    def test_prefix_query_returns_sorted_items(self) -> None:
+        self.assertEqual(
+            self.index.startswith("sai"),
+            [{"text": "Saint-Étienne"}, {"text": "Sainte-Anne"}],
+        )
+
+    def test_exact_query(self) -> None:
+        self.assertEqual(self.index.exact("y"), [{"text": "Y"}])
+        self.assertEqual(self.index.exact("sa"), [])
+
+    def test_contains_query(self) -> None:
+        self.assertEqual(self.index.contains("anne"), [{"text": "Sainte-Anne"}])
+
+    def test_word_prefix_query(self) -> None:
+        self.assertEqual(
+            self.index.word_startswith("e"),
+            [{"text": "Saint-Étienne"}],
+        )
+        self.assertEqual(
+            self.index.word_startswith("sa"),
+            [{"text": "Sada"}, {"text": "Saint-Étienne"}, {"text": "Sainte-Anne"}],
+        )
+        self.assertEqual(self.index.word_startswith("nne"), [])
+
+
+class SearchRelevanceTestCase(TestCase):
+    def setUp(self) -> None:
+        self.index = SearchIndex(
+            [
+                ("Saint-Martin-de-Ré", {"text": "SMR"}, 2500),
+                ("Martigues", {"text": "Martigues"}, 48000),
+                ("Mart", {"text": "Mart"}, None),
+                ("Saint-Martin", {"text": "SM"}, 300),
+                ("Ramartin", {"text": "Ramartin"}, 100000),
+            ]
+        )
+
+    def test_matches_are_ordered_by_relevance(self) -> None:
+        self.assertEqual(
+            [item["text"] for item in self.index.contains("mart")],
+            ["Mart", "Martigues", "SMR", "SM", "Ramartin"],
+        )
+
+    def test_only_the_top_matches_are_returned(self) -> None:
+        self.assertEqual(
+            [item["text"] for item in self.index.contains("mart", limit=2)],
+            ["Mart", "Martigues"],
+        )
+
+    def test_word_prefix_matches_are_ranked_after_the_prefix_matches(self) -> None:
+        self.assertEqual(
+            [item["text"] for item in self.index.word_startswith("mart")],
+            ["Mart", "Martigues", "SMR", "SM"],
+        )
+
+
+class GetSearchIndexTestCase(TestCase):
+    def setUp(self) -> None:
+        clear_search_indexes()
+        self.addCleanup(clear_search_indexes)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.year = DataYear.objects.create(year=2021)
+            dept = Departement.objects.create(name="Mayotte", insee="976")
+            commune = Commune.objects.create(
+                name="Sada", insee="97616", departement=dept, siren="200008878"
+            )
+            commune.years.add(self.year)
+            epci = Epci.objects.create(name="CC du Sud", siren="200060473")
+            epci.years.add(self.year)
+
+    def test_index_is_built_from_database(self) -> None:
+        test_result = get_search_index("communes", 2021).startswith("sad")
+        self.assertEqual(
+            test_result,
+            [
+                {
+                    "value": "200008878",
+                    "text": "Sada (97616)",
+                    "name": "Sada",
+                    "insee": "97616",
+                    "type": "commune",
+                    "slug": "sada-97616",
+                }
+            ],
+        )
+
+    def test_index_is_reused(self) -> None:
+        get_search_index("epcis", 2021)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(get_search_index("epcis", 2021).contains("sud")), 1)
+
+    def test_index_is_rebuilt_after_import(self) -> None:
+        self.assertEqual(len(get_search_index("epcis", 2021)), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            epci = Epci.objects.create(name="CA de Dembéni", siren="200059871")
+            epci.years.add(self.year)
+            DataSource.objects.create(title="Banatic", url="", year=self.year)
+
+        # The data version is checked again once the interval elapsed
+        with mock.patch(
+            "francesubdivisions.services.autocomplete.INDEX_CHECK_INTERVAL", 0
+        ):
+            self.assertEqual(len(get_search_index("epcis", 2021)), 2)
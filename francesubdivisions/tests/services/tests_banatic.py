@@ -5,6 +5,8 @@ import re
 from datetime import datetime
 
 from francesubdivisions.services.banatic import (
+    bulk_import_commune_rows_from_banatic,
+    bulk_import_epci_rows_from_banatic,
     first_day_of_quarter,
     import_commune_row_from_banatic,
     import_epci_row_from_banatic,
@@ -101,7 +103,64 @@ class ImportCommuneRowFromBanaticTestCase(TestCase):
             import_commune_row_from_banatic(row=test_row, year_entry=year_entry)
 
 
-class ImportCommuneRowFromBanaticTestCase(TestCase):
+class BulkImportCommuneRowsFromBanaticTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year_entry = DataYear.objects.create(year=2021)
+        dept = Departement.objects.create(name="Mayotte", insee="976")
+
+        for name, insee in [("Sada", "97616"), ("Tsingoni", "97617")]:
+            commune = Commune.objects.create(name=name, insee=insee, departement=dept)
+            commune.years.add(self.year_entry)
+
+    def test_communes_are_updated(self) -> None:
+        test_rows = [
+            {
+                "insee": "97616",
+                "nom_com": "Sada",
+                "ptot_2021": 11619,
+                "siren": 200008878,
+            },
+            {
+                "insee": "97617",
+                "nom_com": "Tsingoni",
+                "ptot_2021": 13934,
+                "siren": 200008894,
+            },
+        ]
+
+        report = bulk_import_commune_rows_from_banatic(test_rows, self.year_entry)
+
+        self.assertEqual(report["updated"], 2)
+        commune = Commune.objects.get(insee="97616", years=self.year_entry)
+        self.assertEqual(commune.siren, "200008878")
+        self.assertEqual(commune.population, 11619)
+
+    def test_misses_and_mismatches_are_reported(self) -> None:
+        test_rows = [
+            {
+                "insee": "97616",
+                "nom_com": "Sada Bis",
+                "ptot_2021": 1,
+                "siren": 200008878,
+            },
+            {
+                "insee": "97699",
+                "nom_com": "Inconnue",
+                "ptot_2021": 1,
+                "siren": 200008878,
+            },
+            {"insee": "97617", "nom_com": "Tsingoni", "ptot_2021": 1, "siren": 12},
+        ]
+
+        report = bulk_import_commune_rows_from_banatic(test_rows, self.year_entry)
+
+        self.assertEqual(report["updated"], 1)
+        self.assertEqual(report["not_found"], [("97699", "Inconnue")])
+        self.assertEqual(report["name_mismatches"][0][:2], ("97616", "Sada Bis"))
+        self.assertEqual(report["invalid"][0][:2], ("97617", "Tsingoni"))
+
+
+class ImportEpciRowFromBanaticTestCase(TestCase):
     def setUp(self) -> None:
         year_entry = DataYear.objects.create(year=2021)
         dept = Departement.objects.create(name="Lot-et-Garonne", insee="47")
@@ -133,4 +192,51 @@ class ImportCommuneRowFromBanaticTestCase(TestCase):
         year_entry = DataYear.objects.get(year=2021)
         test_commune = Commune.objects.get(insee="47237", years=year_entry)
         test_epci = Epci.objects.get(siren="200023307", years=year_entry)
-        self.assertEqual(test_commune.epci, test_epci)
\ No newline at end of file
+        self.assertEqual(test_commune.epci, test_epci)
+
+
+class BulkImportEpciRowsFromBanaticTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year_entry = DataYear.objects.create(year=2021)
+        dept = Departement.objects.create(name="Lot-et-Garonne", insee="47")
+
+        for name, insee, siren in [
+            ("Sainte-Colombe-de-Villeneuve", "47237", "214702375"),
+            ("Villeneuve-sur-Lot", "47323", "214703233"),
+        ]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, departement=dept, siren=siren
+            )
+            commune.years.add(self.year_entry)
+
+        self.test_rows = [
+            {
+                "Nom du groupement": "CA du Grand Villeneuvois",
+                "Nature juridique": "CA",
+                "N° SIREN": "200023307",
+                "Siren membre": siren,
+            }
+            for siren in ["214702375", "214703233", "214709999"]
+        ]
+
+    def test_epci_is_created_once(self) -> None:
+        report = bulk_import_epci_rows_from_banatic(self.test_rows, self.year_entry)
+
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(Epci.objects.filter(years=self.year_entry).count(), 1)
+
+    def test_epci_is_added_to_communes(self) -> None:
+        report = bulk_import_epci_rows_from_banatic(self.test_rows, self.year_entry)
+
+        test_epci = Epci.objects.get(siren="200023307")
+        self.assertEqual(report["communes"], 2)
+        self.assertEqual(report["not_found"], ["214709999"])
+        self.assertEqual(Commune.objects.filter(epci=test_epci).count(), 2)
+
+    def test_second_import_is_skipped(self) -> None:
+        bulk_import_epci_rows_from_banatic(self.test_rows, self.year_entry)
+        report = bulk_import_epci_rows_from_banatic(self.test_rows, self.year_entry)
+
+        self.assertEqual(report["created"], 0)
+        self.assertEqual(report["skipped"], 1)
+        self.assertEqual(Epci.objects.count(), 1)
@@ -8,11 +8,19 @@ from francesubdivisions.models import (
     Region,
     RegionData,
 )
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+from unittest import mock
+from zipfile import ZipFile
 from django.test import TestCase
 from francesubdivisions.services.cog import (
+    bulk_import_communes_from_cog,
+    get_cog_years,
     import_commune_from_cog,
     import_departement_from_cog,
     import_region_from_cog,
+    open_cog_rows,
 )
 
 
@@ -118,3 +126,128 @@ class ImportCommuneFromCogTestCase(TestCase):
         test_data_tncc = CommuneData.objects.get(commune=test_item, datacode="tncc")
         self.assertEqual(test_data_nccenr.value, "Sada")
         self.assertEqual(test_data_tncc.value, "0")
+
+
+class BulkImportCommunesFromCogTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year_entry = DataYear.objects.create(year=2021)
+        self.source_entry = DataSource.objects.create(
+            title=f"COG test", url="https://test.com/communes.csv", year=self.year_entry
+        )
+
+        departement = Departement.objects.create(name="Mayotte", insee="976")
+        departement.years.add(self.year_entry)
+
+        # Already imported for a previous year
+        previous_year = DataYear.objects.create(year=2020)
+        commune = Commune.objects.create(
+            name="Sada", insee="97616", departement=departement
+        )
+        commune.years.add(previous_year)
+
+        self.test_rows = [
+            {
+                "dept": "976",
+                "insee": "97616",
+                "name": "Sada",
+                "nccenr": "Sada",
+                "tncc": "0",
+            },
+            {
+                "dept": "976",
+                "insee": "97617",
+                "name": "Tsingoni",
+                "nccenr": "Tsingoni",
+                "tncc": "0",
+            },
+        ]
+
+    def test_communes_are_created_and_linked_to_year(self) -> None:
+        report = bulk_import_communes_from_cog(
+            self.test_rows, self.year_entry, self.source_entry
+        )
+
+        self.assertEqual(report, {"created": 1, "updated_year": 1, "skipped": 0})
+        self.assertEqual(Commune.objects.filter(years=self.year_entry).count(), 2)
+        self.assertEqual(Commune.objects.get(insee="97617").slug, "tsingoni-97617")
+        self.assertEqual(Commune.objects.get(insee="97617").search_name, "tsingoni")
+
+    def test_metadata_is_inserted(self) -> None:
+        bulk_import_communes_from_cog(
+            self.test_rows, self.year_entry, self.source_entry
+        )
+
+        test_item = Commune.objects.get(insee="97617")
+        test_data_nccenr = CommuneData.objects.get(commune=test_item, datacode="nccenr")
+        self.assertEqual(test_data_nccenr.value, "Tsingoni")
+
+    def test_second_import_is_skipped(self) -> None:
+        bulk_import_communes_from_cog(
+            self.test_rows, self.year_entry, self.source_entry
+        )
+        report = bulk_import_communes_from_cog(
+            self.test_rows, self.year_entry, self.source_entry
+        )
+
+        self.assertEqual(report, {"created": 0, "updated_year": 0, "skipped": 2})
+        self.assertEqual(Commune.objects.count(), 2)
+        self.assertEqual(CommuneData.objects.count(), 4)
+
+    def test_import_uses_a_constant_number_of_queries(self) -> None:
+        with self.assertNumQueries(8):
+            bulk_import_communes_from_cog(
+                self.test_rows, self.year_entry, self.source_entry
+            )
+
+
+class OpenCogRowsTestCase(TestCase):
+    def setUp(self) -> None:
+        year_entry = DataYear.objects.create(year=2021)
+        self.source_entry = DataSource.objects.create(
+            title=f"COG test", url="https://test.com/regions.zip", year=year_entry
+        )
+
+        archive = BytesIO()
+        with ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("region2021.csv", "REG,LIBELLE\n01,Guadeloupe\n")
+        self.archive_content = archive.getvalue()
+
+        patcher = mock.patch("francesubdivisions.services.cog.open_url")
+        self.mock_open_url = patcher.start()
+        self.mock_open_url.side_effect = lambda url, local_path: BytesIO(
+            self.archive_content
+        )
+        self.addCleanup(patcher.stop)
+
+    def test_rows_are_parsed(self) -> None:
+        with open_cog_rows(
+            self.source_entry, "region2021.csv", {"insee": "REG", "name": "LIBELLE"}
+        ) as (rows, sha256):
+            self.assertEqual(list(rows), [{"insee": "01", "name": "Guadeloupe"}])
+        self.assertEqual(len(sha256), 64)
+
+    def test_unchanged_file_is_not_parsed(self) -> None:
+        open_rows = partial(
+            open_cog_rows, self.source_entry, "region2021.csv", {"insee": "REG"}
+        )
+        with open_rows() as (_rows, sha256):
+            self.source_entry.record_import(sha256, 1, timedelta(seconds=1))
+
+        with open_rows() as (rows, _sha256):
+            self.assertIsNone(rows)
+
+        with open_rows(force=True) as (rows, _sha256):
+            self.assertEqual(list(rows), [{"insee": "01"}])
+
+
+class GetCogYearsTestCase(TestCase):
+    def test_only_years_with_all_levels_are_returned(self) -> None:
+        manifest = {
+            "resources": [
+                {"title": f"Millésime {year} : Liste des {level}", "url": ""}
+                for year in [2018, 2019, 2020, 2021]
+                for level in ["régions", "départements", "communes"]
+                if (year, level) != (2021, "communes")
+            ]
+        }
+        self.assertEqual(get_cog_years(manifest), [2019, 2020])
@@ -0,0 +1,70 @@
+from django.test import TestCase
+
+from francesubdivisions.models import (
+    Commune,
+    CommuneData,
+    DataSource,
+    DataYear,
+    Departement,
+)
+from francesubdivisions.services.data import (
+    DATA_MAX_VALUES,
+    get_data_matrix,
+    split_values,
+)
+
+
+class DataMatrixTestCase(TestCase):
+    def setUp(self) -> None:
+        year_2020 = DataYear.objects.create(year=2020)
+        year_2021 = DataYear.objects.create(year=2021)
+        source = DataSource.objects.create(
+            title="Test title", url="http://test-url.com", year=year_2021
+        )
+        dept = Departement.objects.create(name="Mayotte", insee="976")
+        acoua = Commune.objects.create(
+            name="Acoua", insee="97601", siren="297601007", departement=dept
+        )
+        bandraboua = Commune.objects.create(
+            name="Bandraboua", insee="97602", siren="297602005", departement=dept
+        )
+        CommuneData.objects.upsert(
+            [
+                (acoua.id, year_2020.id, "population", "4900", "int", source.id),
+                (acoua.id, year_2021.id, "population", "5000", "int", source.id),
+                (acoua.id, year_2021.id, "area", "12.6", "float", source.id),
+                (bandraboua.id, year_2021.id, "population", "10000", "int", source.id),
+            ]
+        )
+
+    def test_matrix(self) -> None:
+        with self.assertNumQueries(1):
+            data = get_data_matrix(
+                "communes",
+                ["97601", "297602005", "97699"],
+                ["population", "area"],
+                [2020, 2021],
+            )
+        self.assertEqual(
+            data["values"],
+            [
+                [["4900", None], ["5000", "12.6"]],
+                [[None, None], ["10000", None]],
+                [[None, None], [None, None]],
+            ],
+        )
+
+    def test_same_commune_by_insee_and_siren(self) -> None:
+        data = get_data_matrix("communes", ["97601", "297601007"], ["area"], [2021])
+        self.assertEqual(data["values"], [[["12.6"]], [["12.6"]]])
+
+    def test_errors(self) -> None:
+        with self.assertRaises(ValueError):
+            get_data_matrix("cantons", ["97601"], ["area"], [2021])
+        with self.assertRaises(ValueError):
+            get_data_matrix(
+                "communes", ["97601"] * (DATA_MAX_VALUES + 1), ["area"], [2021]
+            )
+
+    def test_split_values(self) -> None:
+        self.assertEqual(split_values("97601, 97602,,97601"), ["97601", "97602"])
@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.test import TestCase
+
+from francesubdivisions.models import DataYear, Metadata, Region
+from francesubdivisions.services.data_version import (
+    bump_data_version,
+    get_data_version,
+)
+
+
+class DataVersionTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_version_is_created_by_migration(self) -> None:
+        self.assertTrue(Metadata.objects.filter(prop="data_version").exists())
+
+    def test_version_is_unknown_without_metadata(self) -> None:
+        Metadata.objects.filter(prop="data_version").delete()
+        self.assertIsNone(get_data_version())
+
+    def test_bump_stores_version(self) -> None:
+        version = bump_data_version()
+        self.assertEqual(get_data_version(), version)
+        self.assertEqual(
+            Metadata.objects.get(prop="data_version").value, version.isoformat()
+        )
+
+    def test_version_is_read_from_cache(self) -> None:
+        bump_data_version()
+        with self.assertNumQueries(0):
+            get_data_version()
+
+    def test_version_is_shared_through_database(self) -> None:
+        version = bump_data_version()
+        cache.clear()
+        self.assertEqual(get_data_version(), version)
+
+    def test_model_save_bumps_version_on_commit(self) -> None:
+        version = bump_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            DataYear.objects.create(year=2021)
+            # The responses rendered before the commit have the previous version
+            self.assertEqual(get_data_version(), version)
+        self.assertGreater(get_data_version(), version)
+
+    def test_years_change_bumps_version(self) -> None:
+        # The version is bumped once per transaction, so the entries are committed
+        with self.captureOnCommitCallbacks(execute=True):
+            region = Region.objects.create(name="Mayotte", insee="06")
+            year = DataYear.objects.create(year=2021)
+        version = bump_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            region.years.add(year)
+        self.assertGreater(get_data_version(), version)
+
+    def test_version_is_bumped_once_per_transaction(self) -> None:
+        with self.captureOnCommitCallbacks() as callbacks:
+            region = Region.objects.create(name="Mayotte", insee="06")
+            year = DataYear.objects.create(year=2021)
+            region.years.add(year)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_rolled_back_change_does_not_prevent_the_bump(self) -> None:
+        version = bump_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    DataYear.objects.create(year=2020)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            DataYear.objects.create(year=2021)
+        self.assertGreater(get_data_version(), version)
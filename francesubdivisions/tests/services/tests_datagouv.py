@@ -0,0 +1,48 @@
+import json
+import re
+from tempfile import TemporaryDirectory
+from django.test import TestCase
+
+from francesubdivisions.services.datagouv import get_datagouv_file
+
+
+class GetDatagouvFileTestCase(TestCase):
+    MANIFEST = {
+        "resources": [
+            {
+                "title": "Millésime 2020 : Liste des régions",
+                "url": "https://test.com/region2020-csv.zip",
+            },
+            {
+                "title": "Millésime 2021 : Liste des régions",
+                "url": "https://test.com/region2021-csv.zip",
+            },
+            {
+                "title": "Millésime 2021 : Liste des départements",
+                "url": "https://test.com/departement2021-csv.zip",
+            },
+        ]
+    }
+
+    def setUp(self) -> None:
+        self.from_dir = TemporaryDirectory()
+        self.addCleanup(self.from_dir.cleanup)
+        with open(f"{self.from_dir.name}/dataset-id.json", "w") as f:
+            json.dump(self.MANIFEST, f)
+
+    def test_files_are_read_from_saved_manifest(self) -> None:
+        region_regex = re.compile(r"Millésime (?P<year>\d{4})\s: Liste des régions")
+
+        test_result = get_datagouv_file(
+            "dataset-id", region_regex, min_year=2021, from_dir=self.from_dir.name
+        )
+        self.assertEqual(
+            test_result,
+            {
+                2021: {
+                    "title": "Millésime 2021 : Liste des régions",
+                    "url": "https://test.com/region2021-csv.zip",
+                    "year": 2021,
+                }
+            },
+        )
@@ -0,0 +1,67 @@
+from django.test import TestCase
+
+from francesubdivisions.models import Commune, DataYear, Departement, Epci, Region
+from francesubdivisions.services.export import export_queryset, stream_rows
+
+
+class ExportTestCase(TestCase):
+    def setUp(self) -> None:
+        year_2020 = DataYear.objects.create(year=2020)
+        year_2021 = DataYear.objects.create(year=2021)
+        region = Region.objects.create(name="Mayotte", insee="06")
+        self.mayotte = Departement.objects.create(
+            name="Mayotte", insee="976", region=region
+        )
+        martinique = Departement.objects.create(name="Martinique", insee="972")
+        epci = Epci.objects.create(name="CC du Sud", siren="200060473")
+        for insee, name, dept, years in [
+            ("97601", "Acoua", self.mayotte, [year_2020, year_2021]),
+            ("97602", "Bandraboua", self.mayotte, [year_2020]),
+            ("97201", "L'Ajoupa-Bouillon", martinique, [year_2021]),
+        ]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, departement=dept, epci=epci
+            )
+            commune.years.add(*years)
+
+    def get_insee_ids(self, **filters) -> list:
+        return [row[2] for row in export_queryset("communes", **filters)]
+
+    def test_communes_are_exported_as_tuples(self) -> None:
+        self.assertEqual(
+            export_queryset("communes").first()[1:],
+            ("Acoua", "97601", "", None, "acoua-97601", "976", "200060473"),
+        )
+
+    def test_filters(self) -> None:
+        self.assertEqual(self.get_insee_ids(), ["97601", "97602", "97201"])
+        self.assertEqual(self.get_insee_ids(year=2021), ["97601", "97201"])
+        self.assertEqual(self.get_insee_ids(departement="976"), ["97601", "97602"])
+        self.assertEqual(self.get_insee_ids(year=2021, departement="976"), ["97601"])
+
+    def test_other_levels_are_filtered_by_departement(self) -> None:
+        self.assertEqual(
+            [row[1] for row in export_queryset("regions", departement="976")],
+            ["Mayotte"],
+        )
+        self.assertEqual(export_queryset("regions", departement="972").count(), 0)
+        self.assertEqual(
+            [row[2] for row in export_queryset("departements", departement="976")],
+            ["976"],
+        )
+        # The EPCI is listed once, though it has two communes in the département
+        self.assertEqual(
+            [row[2] for row in export_queryset("epcis", departement="976")],
+            ["200060473"],
+        )
+
+    def test_unknown_level(self) -> None:
+        with self.assertRaises(ValueError):
+            export_queryset("cantons")
+
+    def test_csv_has_a_header(self) -> None:
+        lines = list(
+            stream_rows(export_queryset("epcis"), "csv", ["id", "name", "siren"])
+        )
+        self.assertEqual(lines[0], "id,name,siren\r\n")
+        self.assertEqual(len(lines), 2)
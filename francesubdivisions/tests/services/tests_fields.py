@@ -0,0 +1,18 @@
+from django.test import TestCase
+
+from francesubdivisions.services.fields import parse_fields
+
+
+class ParseFieldsTestCase(TestCase):
+    def test_all_fields_by_default(self) -> None:
+        self.assertEqual(parse_fields("epcis"), ["id", "name", "siren"])
+        self.assertEqual(parse_fields("epcis", ""), ["id", "name", "siren"])
+
+    def test_id_is_always_returned_first(self) -> None:
+        self.assertEqual(
+            parse_fields("communes", "insee, name,id,insee"), ["id", "insee", "name"]
+        )
+
+    def test_unknown_fields(self) -> None:
+        with self.assertRaisesMessage(ValueError, "Unknown fields years, epci"):
+            parse_fields("communes", "name,years,epci")
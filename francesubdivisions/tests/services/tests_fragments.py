@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+from django.test import TestCase
+
+from francesubdivisions.models import Commune, DataYear, Departement, Region
+from francesubdivisions.schemas import CommuneSchema
+from francesubdivisions.services.fragments import (
+    attach_fragments,
+    check_fragments,
+    clear_fragments,
+    get_fragment,
+)
+
+
+class FragmentsTestCase(TestCase):
+    def setUp(self) -> None:
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+        year = DataYear.objects.create(year=2021)
+        self.region = Region.objects.create(
+            name="Mayotte", insee="06", siren="237500079"
+        )
+        self.region.years.add(year)
+        self.dept = Departement.objects.create(
+            name="Mayotte", insee="976", region=self.region
+        )
+
+    def test_fragment_holds_the_serialized_entry(self) -> None:
+        fragment = get_fragment("departements", self.dept.id)
+        self.assertEqual(
+            fragment.payload,
+            {
+                "id": self.dept.id,
+                "name": "Mayotte",
+                "insee": "976",
+                "siren": None,
+                "region": {
+                    "id": self.region.id,
+                    "name": "Mayotte",
+                    "insee": "06",
+                    "siren": "237500079",
+                    "years": [{"year": 2021}],
+                },
+                "years": [],
+            },
+        )
+
+    def test_fragments_are_built_once(self) -> None:
+        fragment = get_fragment("regions", self.region.id)
+        with self.assertNumQueries(0):
+            self.assertIs(get_fragment("regions", self.region.id), fragment)
+        self.assertIsNone(get_fragment("regions", None))
+
+    def test_fragments_follow_the_data_version(self) -> None:
+        check_fragments("version 1")
+        fragment = get_fragment("regions", self.region.id)
+        check_fragments("version 1")
+        self.assertIs(get_fragment("regions", self.region.id), fragment)
+        check_fragments("version 2")
+        self.assertIsNot(get_fragment("regions", self.region.id), fragment)
+
+    def test_new_entries_are_found(self) -> None:
+        get_fragment("regions", self.region.id)
+        region = Region.objects.create(name="La Réunion", insee="04")
+        self.assertEqual(get_fragment("regions", region.id).payload["insee"], "04")
+
+    def test_schemas_serialize_the_payload(self) -> None:
+        commune = SimpleNamespace(id=1, departement_id=self.dept.id, epci_id=None)
+        fragment = get_fragment("departements", self.dept.id)
+
+        data = CommuneSchema.from_orm(commune).model_dump()
+        self.assertEqual(data["departement"], fragment.payload)
+        self.assertIsNone(data["epci"])
+
+        with self.settings(FRANCESUBDIVISIONS_JSON_FRAGMENTS=True):
+            data = CommuneSchema.from_orm(commune).model_dump()
+        self.assertIs(data["departement"], fragment)
+
+    def test_attached_fragments_are_serialized_without_lookup(self) -> None:
+        Commune.objects.create(name="Acoua", insee="97601", departement=self.dept)
+        commune = Commune.objects.prefetch_related("years").get()
+        attach_fragments([commune, {"id": commune.id}])
+        clear_fragments()
+
+        with self.assertNumQueries(0):
+            data = CommuneSchema.from_orm(commune).model_dump()
+        self.assertEqual(data["departement"]["insee"], "976")
+        self.assertIsNone(data["epci"])
@@ -0,0 +1,60 @@
+from django.test import TestCase
+
+from francesubdivisions.models import Commune, DataYear, Departement, Epci, Region
+from francesubdivisions.services.hierarchy import build_hierarchy
+
+
+class HierarchyTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year = DataYear.objects.create(year=2021)
+        other_year = DataYear.objects.create(year=2020)
+        region = Region.objects.create(name="Mayotte", insee="06", siren="200050532")
+        region.years.add(self.year)
+        mayotte = Departement.objects.create(name="Mayotte", insee="976", region=region)
+        mayotte.years.add(self.year)
+        martinique = Departement.objects.create(name="Martinique", insee="972")
+        martinique.years.add(self.year)
+        sud = Epci.objects.create(name="CC du Sud", siren="200060473")
+        centre = Epci.objects.create(name="CC Centre-Ouest", siren="200059871")
+        for insee, name, dept, epci, year in [
+            ("97601", "Acoua", mayotte, sud, self.year),
+            ("97602", "Bandraboua", mayotte, centre, self.year),
+            ("97603", "Bandrele", mayotte, None, self.year),
+            ("97604", "Boueni", mayotte, sud, other_year),
+            ("97201", "L'Ajoupa-Bouillon", martinique, sud, self.year),
+        ]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, departement=dept, epci=epci
+            )
+            commune.years.add(year)
+
+    def test_tree(self) -> None:
+        with self.assertNumQueries(4):
+            hierarchy = build_hierarchy(self.year)
+
+        self.assertEqual(hierarchy["year"], 2021)
+        self.assertEqual(len(hierarchy["regions"]), 1)
+        region = hierarchy["regions"][0]
+        self.assertEqual(region["siren"], "200050532")
+        self.assertEqual([dept["insee"] for dept in region["departements"]], ["976"])
+
+        # The EPCIs are sorted by name, and only list the communes of the year
+        mayotte = region["departements"][0]
+        self.assertEqual(
+            [(epci["name"], len(epci["communes"])) for epci in mayotte["epcis"]],
+            [("CC Centre-Ouest", 1), ("CC du Sud", 1)],
+        )
+        self.assertEqual(mayotte["epcis"][1]["communes"][0]["insee"], "97601")
+
+    def test_communes_without_epci(self) -> None:
+        mayotte = build_hierarchy(self.year)["regions"][0]["departements"][0]
+        self.assertEqual(
+            mayotte["communes"],
+            [{"insee": "97603", "siren": "", "name": "Bandrele", "population": None}],
+        )
+
+    def test_departements_without_region(self) -> None:
+        orphans = build_hierarchy(self.year)["departements"]
+        self.assertEqual([dept["insee"] for dept in orphans], ["972"])
+        # An EPCI is listed in each of the départements of its communes
+        self.assertEqual(orphans[0]["epcis"][0]["siren"], "200060473")
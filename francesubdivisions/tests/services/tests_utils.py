@@ -1,8 +1,18 @@
+from argparse import ArgumentTypeError
+import os
 from io import StringIO
-from django.test import TestCase
+from tempfile import TemporaryDirectory
+from django.test import TestCase, override_settings
 from unittest import mock
 
 from francesubdivisions.services.utils import (
+    batched,
+    download_to_tempfile,
+    get_download_cache_entry,
+    get_local_path,
+    iter_csv_from_stream,
+    open_url,
+    parse_years,
     file_exists_at_url,
     get_zip_from_url,
     parse_csv_from_distant_zip,
@@ -22,6 +32,122 @@ class FileExistsAtUrlTestCase(TestCase):
         self.assertFalse(result)
 
 
+class DownloadToTempfileTestCase(TestCase):
+    def test_file_is_written_by_chunks(self) -> None:
+        with mock.patch("francesubdivisions.services.utils.requests") as mock_requests:
+            response = mock_requests.get.return_value.__enter__.return_value
+            response.iter_content.return_value = [b"first,", b"second"]
+
+            temp_file = download_to_tempfile("https://test.com/file.zip")
+
+            mock_requests.get.assert_called_once_with(
+                "https://test.com/file.zip", stream=True
+            )
+            self.assertEqual(temp_file.read(), b"first,second")
+
+
+class OpenUrlTestCase(TestCase):
+    URL = "https://test.com/file.zip"
+
+    def setUp(self) -> None:
+        self.cache_dir = TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+        patcher = mock.patch("francesubdivisions.services.utils.requests")
+        self.mock_requests = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.response = self.mock_requests.get.return_value.__enter__.return_value
+        self.response.status_code = 200
+        self.response.headers = {"ETag": '"v1"'}
+        self.response.iter_content.return_value = [b"content"]
+
+    def test_local_file_is_not_downloaded(self) -> None:
+        with open(f"{self.cache_dir.name}/file.zip", "wb") as f:
+            f.write(b"local content")
+
+        with open_url(self.URL, f"{self.cache_dir.name}/file.zip") as f:
+            self.assertEqual(f.read(), b"local content")
+        self.mock_requests.get.assert_not_called()
+
+    def test_file_is_downloaded_without_cache(self) -> None:
+        with open_url(self.URL) as f:
+            self.assertEqual(f.read(), b"content")
+
+    def test_file_is_stored_in_cache(self) -> None:
+        with override_settings(
+            FRANCESUBDIVISIONS_DOWNLOAD_CACHE_DIR=self.cache_dir.name
+        ):
+            with open_url(self.URL) as f:
+                self.assertEqual(f.read(), b"content")
+
+        entry = get_download_cache_entry(self.URL, self.cache_dir.name)
+        self.assertEqual(entry["etag"], '"v1"')
+        self.assertEqual(
+            entry["sha256"],
+            "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73",
+        )
+
+    def test_cached_file_is_revalidated(self) -> None:
+        with override_settings(
+            FRANCESUBDIVISIONS_DOWNLOAD_CACHE_DIR=self.cache_dir.name
+        ):
+            open_url(self.URL).close()
+
+            self.response.status_code = 304
+            self.response.iter_content.return_value = []
+            with open_url(self.URL) as f:
+                self.assertEqual(f.read(), b"content")
+
+        self.mock_requests.get.assert_called_with(
+            self.URL, headers={"If-None-Match": '"v1"'}, stream=True
+        )
+
+    def test_previous_file_is_removed(self) -> None:
+        with override_settings(
+            FRANCESUBDIVISIONS_DOWNLOAD_CACHE_DIR=self.cache_dir.name
+        ):
+            open_url(self.URL).close()
+
+            self.response.headers = {"ETag": '"v2"'}
+            self.response.iter_content.return_value = [b"new content"]
+            with open_url(self.URL) as f:
+                self.assertEqual(f.read(), b"new content")
+
+        entry = get_download_cache_entry(self.URL, self.cache_dir.name)
+        self.assertEqual(
+            os.listdir(os.path.join(self.cache_dir.name, "files")), [entry["sha256"]]
+        )
+
+    def test_failed_download_is_removed(self) -> None:
+        self.response.iter_content.side_effect = ConnectionError
+        with override_settings(
+            FRANCESUBDIVISIONS_DOWNLOAD_CACHE_DIR=self.cache_dir.name
+        ):
+            with self.assertRaises(ConnectionError):
+                open_url(self.URL)
+
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir.name, "files")), [])
+
+
+class GetLocalPathTestCase(TestCase):
+    URL = "https://www.insee.fr/fr/statistiques/fichier/4316069/region2020-csv.zip"
+
+    def test_file_has_priority(self) -> None:
+        self.assertEqual(get_local_path(self.URL, "/data", "/tmp/a.zip"), "/tmp/a.zip")
+
+    def test_file_is_named_after_url(self) -> None:
+        self.assertEqual(get_local_path(self.URL, "/data"), "/data/region2020-csv.zip")
+
+    def test_file_name_can_be_specified(self) -> None:
+        self.assertEqual(
+            get_local_path(self.URL, "/data", filename="regions.zip"),
+            "/data/regions.zip",
+        )
+
+    def test_no_local_path_without_dir_or_file(self) -> None:
+        self.assertIsNone(get_local_path(self.URL))
+
+
 class ParseCsvFromDistantZipTestCase(TestCase):
     def test_parse_actual_csv(self) -> None:
         column_names = {
@@ -95,3 +221,58 @@ COMD,01015,,,,1,ARBIGNIEU,Arbignieu,Arbignieu,,01015"""
             test_result[0],
             {"insee": "01001", "name": "L'Abergement-Clémenciat", "dept": "01"},
         )
+
+
+class IterCsvFromStreamTestCase(TestCase):
+    def test_rows_are_projected_to_tuples(self) -> None:
+        stream = StringIO(
+            """\
+dep,reg,cheflieu,tncc,ncc,nccenr,libelle
+01,84,01053,5,AIN,Ain,Ain
+02,32,02408,5,AISNE,Aisne,Aisne"""
+        )
+        test_result = iter_csv_from_stream(stream, {"name": "libelle", "insee": "dep"})
+
+        self.assertEqual(next(test_result), ("Ain", "01"))
+        self.assertEqual(next(test_result), ("Aisne", "02"))
+
+    def test_single_column_is_a_tuple(self) -> None:
+        stream = StringIO("dep,libelle\n01,Ain")
+        test_result = list(iter_csv_from_stream(stream, {"insee": "dep"}))
+
+        self.assertEqual(test_result, [("01",)])
+
+    def test_empty_stream_yields_nothing(self) -> None:
+        self.assertEqual(list(iter_csv_from_stream(StringIO(""), {"insee": "dep"})), [])
+
+    def test_blank_lines_are_skipped(self) -> None:
+        stream = StringIO("dep,libelle,typ\n01,Ain,DEP\n\n02,Aisne,DEP\n\n")
+        self.assertEqual(
+            list(iter_csv_from_stream(stream, {"insee": "dep"})), [("01",), ("02",)]
+        )
+
+        stream.seek(0)
+        test_result = iter_csv_from_stream(
+            stream, {"insee": "dep"}, typecheck={"column": "typ", "value": "DEP"}
+        )
+        self.assertEqual(list(test_result), [("01",), ("02",)])
+
+
+class BatchedTestCase(TestCase):
+    def test_iterable_is_split(self) -> None:
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+
+class ParseYearsTestCase(TestCase):
+    def test_range_is_parsed(self) -> None:
+        self.assertEqual(parse_years("2019-2021"), [2019, 2020, 2021])
+
+    def test_list_is_parsed(self) -> None:
+        self.assertEqual(parse_years("2021,2019"), [2019, 2021])
+
+    def test_invalid_value_is_rejected(self) -> None:
+        with self.assertRaises(ArgumentTypeError):
+            parse_years("2019-")
+
+        with self.assertRaises(ArgumentTypeError):
+            parse_years("2021-2019")
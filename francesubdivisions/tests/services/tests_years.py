@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from francesubdivisions.models import DataYear, Metadata
+from francesubdivisions.services.years import clear_current_years, get_current_year
+
+
+class GetCurrentYearTestCase(TestCase):
+    def setUp(self) -> None:
+        clear_current_years()
+        self.addCleanup(clear_current_years)
+
+        for year in [999, 2020, 2021]:
+            DataYear.objects.create(year=year)
+            Metadata.objects.create(prop="cog_communes_year", value=year)
+
+    def test_years_are_compared_as_integers(self) -> None:
+        self.assertEqual(get_current_year("communes").year, 2021)
+
+    def test_year_is_cached(self) -> None:
+        get_current_year("communes")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_current_year("communes").year, 2021)
+
+    def test_cache_is_cleared_when_metadata_is_written(self) -> None:
+        get_current_year("communes")
+        DataYear.objects.create(year=2022)
+        Metadata.objects.get_or_create(prop="cog_communes_year", value=2022)
+
+        self.assertEqual(get_current_year("communes").year, 2022)
+
+    def test_level_without_year(self) -> None:
+        with self.assertRaises(DataYear.DoesNotExist):
+            get_current_year("epcis")
+
+    def test_unknown_level(self) -> None:
+        with self.assertRaises(ValueError):
+            get_current_year("cantons")
@@ -0,0 +1,598 @@
+import csv
+import gzip
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from ninja.testing import TestClient
+
+from francesubdivisions.api import router
+from francesubdivisions.models import (
+    Commune,
+    CommuneData,
+    DataSource,
+    DataYear,
+    Departement,
+    Epci,
+    Metadata,
+    Region,
+)
+from francesubdivisions.schemas import RESOLVE_MAX_CODES
+from francesubdivisions.services.autocomplete import clear_search_indexes
+from francesubdivisions.services.fragments import clear_fragments
+from francesubdivisions.services.years import clear_current_years
+
+client = TestClient(router)
+
+SIRENS = {
+    "97601": "297601007",
+    "97602": "297602005",
+    "97603": "297603003",
+    "97604": "297604001",
+}
+
+
+class ListEndpointsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # The ids of the entries may be reused by the previous tests
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+        year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(name="Mayotte", insee="06")
+        region.years.add(year)
+        dept = Departement.objects.create(name="Mayotte", insee="976", region=region)
+        dept.years.add(year)
+        epci = Epci.objects.create(name="CC du Sud", siren="200060473")
+        epci.years.add(year)
+        for insee, name in [("97601", "Acoua"), ("97602", "Bandraboua")]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, departement=dept, epci=epci
+            )
+            commune.years.add(year)
+        self.communes_ids = list(
+            Commune.objects.order_by("id").values_list("id", flat=True)
+        )
+
+    def test_communes_endpoint_lists_communes(self) -> None:
+        response = client.get("/communes")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["insee"] for item in response.json()["items"]], ["97601", "97602"]
+        )
+        self.assertIsNone(response.json()["next_cursor"])
+
+    def test_pages_follow_the_cursor(self) -> None:
+        response = client.get("/communes?page_size=1")
+        self.assertEqual(response.json()["items"][0]["name"], "Acoua")
+        self.assertEqual(response.json()["next_cursor"], self.communes_ids[0])
+
+        response = client.get(
+            f"/communes?page_size=1&cursor={response.json()['next_cursor']}"
+        )
+        self.assertEqual(response.json()["items"][0]["name"], "Bandraboua")
+        self.assertIsNone(response.json()["next_cursor"])
+
+    @override_settings(FRANCESUBDIVISIONS_PAGE_SIZE=1)
+    def test_page_size_setting(self) -> None:
+        response = client.get("/communes")
+        self.assertEqual(len(response.json()["items"]), 1)
+
+    @override_settings(FRANCESUBDIVISIONS_MAX_PAGE_SIZE=1)
+    def test_page_size_is_capped(self) -> None:
+        response = client.get("/communes?page_size=100")
+        self.assertEqual(len(response.json()["items"]), 1)
+
+    def test_other_levels_are_paginated(self) -> None:
+        for path in ["/regions", "/departements", "/epcis"]:
+            response = client.get(path)
+            self.assertEqual(len(response.json()["items"]), 1)
+            self.assertIsNone(response.json()["next_cursor"])
+
+
+class EndpointsQueryCountTestCase(TestCase):
+    """
+    The years are loaded in a fixed number of queries, and the nested relations
+    are read from their Fragments, built once per data version
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(name="Mayotte", insee="06", siren="237500079")
+        region.years.add(self.year)
+        self.dept = Departement.objects.create(
+            name="Mayotte", insee="976", region=region, siren="220100010"
+        )
+        self.dept.years.add(self.year)
+        self.epci = Epci.objects.create(name="CC du Sud", siren="200060473")
+        self.epci.years.add(self.year)
+        self.add_communes(["97601"])
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+
+    def add_communes(self, insee_ids: list) -> None:
+        for insee in insee_ids:
+            commune = Commune.objects.create(
+                name=f"Commune {insee}",
+                insee=insee,
+                siren=SIRENS[insee],
+                departement=self.dept,
+                epci=self.epci,
+            )
+            commune.years.add(self.year)
+
+    def warm_fragments(self) -> None:
+        client.get("/communes?page_size=1")
+
+    def test_fragments_are_built_once(self) -> None:
+        # The data version, the communes and their years, then the départements,
+        # regions and EPCIs with their years
+        with self.assertNumQueries(9):
+            client.get("/communes")
+        with self.assertNumQueries(2):
+            client.get("/communes?page_size=10")
+
+    def test_list_endpoints(self) -> None:
+        self.warm_fragments()
+        for path, num_queries in [
+            ("/regions", 2),
+            ("/departements", 2),
+            ("/epcis", 2),
+            ("/communes", 2),
+        ]:
+            with self.assertNumQueries(num_queries):
+                client.get(path)
+
+    def test_communes_list_query_count_does_not_grow(self) -> None:
+        self.add_communes(["97602", "97603", "97604"])
+        self.warm_fragments()
+        with self.assertNumQueries(2):
+            response = client.get("/communes")
+        self.assertEqual(len(response.json()["items"]), 4)
+
+    def test_detail_endpoints(self) -> None:
+        self.warm_fragments()
+        for path, num_queries in [
+            ("/regions/237500079", 2),
+            ("/departements/220100010", 2),
+            ("/epcis/200060473", 2),
+            ("/communes/97601", 2),
+            ("/communes/297601007", 2),
+            ("/communes/siren/297601007", 2),
+            ("/communes/insee/97601", 2),
+        ]:
+            with self.assertNumQueries(num_queries):
+                response = client.get(path)
+            self.assertEqual(response.status_code, 200)
+
+
+class ConditionalRequestsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            Region.objects.create(name="Mayotte", insee="06", siren="237500079")
+
+    def test_response_has_validators(self) -> None:
+        response = client.get("/regions")
+        self.assertTrue(response.has_header("ETag"))
+        self.assertTrue(response.has_header("Last-Modified"))
+
+    def test_not_modified_is_answered_without_orm_query(self) -> None:
+        etag = client.get("/regions/237500079")["ETag"]
+        with self.assertNumQueries(0):
+            response = client.get(
+                "/regions/237500079", META={"HTTP_IF_NONE_MATCH": etag}
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_data(self) -> None:
+        etag = client.get("/regions")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Region.objects.create(name="La Réunion", insee="04", siren="220100010")
+        response = client.get("/regions", META={"HTTP_IF_NONE_MATCH": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["items"]), 2)
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            Region.objects.create(name="Mayotte", insee="06", siren="237500079")
+
+    def test_response_is_served_from_cache(self) -> None:
+        response = client.get("/regions")
+        with self.assertNumQueries(0):
+            cached_response = client.get("/regions")
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response["Content-Type"], response["Content-Type"])
+
+    def test_query_parameters_are_part_of_the_key(self) -> None:
+        client.get("/regions?page_size=1")
+        with self.assertNumQueries(2):
+            client.get("/regions?page_size=2")
+
+    def test_cache_follows_data_version(self) -> None:
+        client.get("/regions")
+        with self.captureOnCommitCallbacks(execute=True):
+            Region.objects.create(name="La Réunion", insee="04", siren="220100010")
+        self.assertEqual(len(client.get("/regions").json()["items"]), 2)
+
+    def test_errors_are_not_cached(self) -> None:
+        self.assertEqual(client.get("/regions/220100010").status_code, 404)
+        # update() doesn't change the data version
+        Region.objects.filter(insee="06").update(siren="220100010")
+        self.assertEqual(client.get("/regions/220100010").status_code, 200)
+
+
+class ResolveEndpointsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # The ids of the entries may be reused by the previous tests
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+        self.dept = Departement.objects.create(
+            name="Mayotte", insee="976", siren="220100010"
+        )
+        Epci.objects.create(name="CC du Sud", siren="200060473")
+        for insee in ["97601", "97602"]:
+            Commune.objects.create(
+                name=f"Commune {insee}",
+                insee=insee,
+                siren=SIRENS[insee],
+                departement=self.dept,
+            )
+
+    def test_communes_are_resolved_by_insee_or_siren(self) -> None:
+        # The data version, the communes and their years,
+        # then the départements and their years
+        with self.assertNumQueries(5):
+            response = client.post(
+                "/communes/resolve",
+                json={"codes": ["97601", SIRENS["97602"], "97699", "42"]},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(item["insee"] for item in response.json()["items"]),
+            ["97601", "97602"],
+        )
+        self.assertEqual(response.json()["missing"], ["97699", "42"])
+
+    def test_departements_are_resolved(self) -> None:
+        response = client.post(
+            "/departements/resolve", json={"codes": ["976", "971", "220100010"]}
+        )
+        self.assertEqual(len(response.json()["items"]), 1)
+        self.assertEqual(response.json()["missing"], ["971"])
+
+    def test_epcis_are_resolved(self) -> None:
+        response = client.post(
+            "/epcis/resolve", json={"codes": ["200060473", "200060473", "97601"]}
+        )
+        self.assertEqual(len(response.json()["items"]), 1)
+        self.assertEqual(response.json()["missing"], ["97601"])
+
+    def test_number_of_codes_is_limited(self) -> None:
+        response = client.post(
+            "/communes/resolve", json={"codes": ["97601"] * (RESOLVE_MAX_CODES + 1)}
+        )
+        self.assertEqual(response.status_code, 422)
+
+
+class SearchSubdivisionsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        clear_search_indexes()
+        self.addCleanup(clear_search_indexes)
+
+        year = DataYear.objects.create(year=2021)
+        dept = Departement.objects.create(name="Martinique", insee="972")
+        dept.years.add(year)
+        for insee, name, population in [
+            ("97601", "Le Marin", 8500),
+            ("97602", "Marigot", 3200),
+            ("97603", "Mar", 10),
+            ("97604", "Marcillac", 900),
+        ]:
+            commune = Commune.objects.create(
+                name=name,
+                insee=insee,
+                siren=SIRENS[insee],
+                departement=dept,
+                population=population,
+            )
+            commune.years.add(year)
+
+    def get_communes(self, path: str) -> list:
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [item["name"] for item in response.json()[0]["items"]]
+
+    def test_results_are_ordered_by_relevance(self) -> None:
+        for enabled in [True, False]:
+            with self.settings(FRANCESUBDIVISIONS_SEARCH_INDEX=enabled):
+                cache.clear()
+                self.assertEqual(
+                    self.get_communes("/subdivisions/mar?year=2021&category=communes"),
+                    ["Mar", "Marigot", "Marcillac", "Le Marin"],
+                )
+
+    def test_per_group_limit(self) -> None:
+        for enabled in [True, False]:
+            with self.settings(FRANCESUBDIVISIONS_SEARCH_INDEX=enabled):
+                cache.clear()
+                self.assertEqual(
+                    self.get_communes(
+                        "/subdivisions/mar?year=2021&category=communes&per_group_limit=2"
+                    ),
+                    ["Mar", "Marigot"],
+                )
+
+    def test_limit_applies_across_groups(self) -> None:
+        response = client.get("/subdivisions/mar?year=2021&limit=2")
+        self.assertEqual(
+            [(group["groupName"], len(group["items"])) for group in response.json()],
+            [("Départements", 1), ("Communes", 1)],
+        )
+
+
+class ExportEndpointsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        year = DataYear.objects.create(year=2021)
+        dept = Departement.objects.create(name="Mayotte", insee="976")
+        for insee, name in [("97601", "Acoua"), ("97602", "Bandraboua")]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, siren=SIRENS[insee], departement=dept
+            )
+            commune.years.add(year)
+
+    def test_communes_are_streamed_as_ndjson(self) -> None:
+        response = client.get("/export/communes.ndjson?year=2021")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["name"], "Acoua")
+        self.assertEqual(json.loads(lines[1])["departement_insee"], "976")
+
+    def test_communes_are_streamed_as_csv(self) -> None:
+        response = client.get("/export/communes.csv?departement=976")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.reader(response.content.decode().splitlines()))
+        self.assertEqual(rows[0][:3], ["id", "name", "insee"])
+        self.assertEqual([row[2] for row in rows[1:]], ["97601", "97602"])
+
+    def test_unknown_export(self) -> None:
+        self.assertEqual(client.get("/export/communes.xml").status_code, 404)
+        self.assertEqual(client.get("/export/cantons.csv").status_code, 404)
+
+    def test_exports_are_not_cached(self) -> None:
+        client.get("/export/regions.csv")
+        with self.assertNumQueries(1):
+            client.get("/export/regions.csv")
+
+
+class HierarchyEndpointTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        clear_current_years()
+        self.addCleanup(clear_current_years)
+        year = DataYear.objects.create(year=2021)
+        Metadata.objects.create(prop="cog_communes_year", value=2021)
+        dept = Departement.objects.create(name="Mayotte", insee="976")
+        dept.years.add(year)
+        commune = Commune.objects.create(
+            name="Acoua", insee="97601", siren=SIRENS["97601"], departement=dept
+        )
+        commune.years.add(year)
+
+    def test_hierarchy_of_the_current_year(self) -> None:
+        response = client.get("/hierarchy")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        hierarchy = response.json()
+        self.assertEqual(hierarchy["year"], 2021)
+        self.assertEqual(
+            hierarchy["departements"][0]["communes"][0]["siren"], SIRENS["97601"]
+        )
+
+    def test_hierarchy_is_compressed(self) -> None:
+        response = client.get("/hierarchy", headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content)),
+            client.get("/hierarchy").json(),
+        )
+
+    def test_encodings_have_distinct_etags(self) -> None:
+        etag = client.get("/hierarchy")["ETag"]
+        response = client.get("/hierarchy", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response["ETag"], f"W/{etag}")
+
+        # The weak ETag still validates the cached tree
+        response = client.get(
+            "/hierarchy",
+            headers={"Accept-Encoding": "gzip"},
+            META={"HTTP_IF_NONE_MATCH": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(FRANCESUBDIVISIONS_HIERARCHY_GZIP=False)
+    def test_compression_setting(self) -> None:
+        response = client.get("/hierarchy", headers={"Accept-Encoding": "gzip"})
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_hierarchy_is_cached(self) -> None:
+        client.get("/hierarchy?year=2021")
+        # Only the year is read again
+        with self.assertNumQueries(1):
+            response = client.get(
+                "/hierarchy?year=2021", headers={"Accept-Encoding": "gzip"}
+            )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_unknown_year(self) -> None:
+        self.assertEqual(client.get("/hierarchy?year=1999").status_code, 404)
+
+    def test_no_imported_year(self) -> None:
+        Metadata.objects.filter(prop="cog_communes_year").delete()
+        response = client.get("/hierarchy")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"detail": "No year imported for communes"})
+
+
+class DataEndpointTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        clear_current_years()
+        self.addCleanup(clear_current_years)
+        year = DataYear.objects.create(year=2021)
+        Metadata.objects.create(prop="cog_communes_year", value=2021)
+        source = DataSource.objects.create(
+            title="Test title", url="http://test-url.com", year=year
+        )
+        dept = Departement.objects.create(name="Mayotte", insee="976")
+        for insee, population in [("97601", "5000"), ("97602", "10000")]:
+            commune = Commune.objects.create(
+                name=insee, insee=insee, siren=SIRENS[insee], departement=dept
+            )
+            CommuneData.objects.create(
+                commune=commune,
+                year=year,
+                datacode="population",
+                value=population,
+                source=source,
+            )
+
+    def test_values_of_the_current_year(self) -> None:
+        response = client.get(
+            "/data/communes?codes=97601,297602005&datacodes=population,area"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "codes": ["97601", "297602005"],
+                "years": [2021],
+                "datacodes": ["population", "area"],
+                "values": [[["5000", None]], [["10000", None]]],
+            },
+        )
+
+    def test_values_of_several_years(self) -> None:
+        response = client.get(
+            "/data/communes?codes=97601&datacodes=population&years=2020,2021"
+        )
+        self.assertEqual(response.json()["values"], [[[None], ["5000"]]])
+
+    def test_errors(self) -> None:
+        self.assertEqual(
+            client.get("/data/cantons?codes=1&datacodes=population").status_code, 404
+        )
+        self.assertEqual(
+            client.get(
+                "/data/communes?codes=97601&datacodes=population&years=last"
+            ).status_code,
+            400,
+        )
+        # The EPCIs have no imported year
+        response = client.get("/data/epcis?codes=200060473&datacodes=population")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"detail": "No year imported for epcis"})
+
+
+class SparseFieldsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # The ids of the entries may be reused by the previous tests
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+        year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(name="Mayotte", insee="06")
+        dept = Departement.objects.create(name="Mayotte", insee="976", region=region)
+        epci = Epci.objects.create(name="CC du Sud", siren="200060473")
+        for insee, name in [("97601", "Acoua"), ("97602", "Bandraboua")]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, departement=dept, epci=epci
+            )
+            commune.years.add(year)
+        Commune.objects.create(name="Bouéni", insee="97603", departement=dept)
+
+    def test_full_items_are_unchanged(self) -> None:
+        item = client.get("/communes").json()["items"][0]
+        self.assertEqual(item["departement"]["region"]["insee"], "06")
+        self.assertEqual(item["years"], [{"year": 2021}])
+        self.assertNotIn("departement_insee", item)
+
+    def test_flat_items(self) -> None:
+        # The data version, then the communes with their relations in the same query
+        with self.assertNumQueries(2):
+            response = client.get("/communes?flat=true")
+        items = response.json()["items"]
+        self.assertEqual(
+            items[0],
+            {
+                "id": items[0]["id"],
+                "name": "Acoua",
+                "insee": "97601",
+                "siren": "",
+                "population": None,
+                "departement_insee": "976",
+                "epci_siren": "200060473",
+            },
+        )
+        self.assertIsNone(items[2]["epci_siren"])
+
+    def test_sparse_fields(self) -> None:
+        response = client.get("/communes?fields=insee,departement_insee&page_size=2")
+        self.assertEqual(
+            [
+                (item["insee"], item["departement_insee"])
+                for item in response.json()["items"]
+            ],
+            [("97601", "976"), ("97602", "976")],
+        )
+        self.assertEqual(
+            set(response.json()["items"][0]), {"id", "insee", "departement_insee"}
+        )
+
+        # The id of the flat items is the cursor of the next page
+        response = client.get(
+            "/communes?fields=name&cursor=" + str(response.json()["next_cursor"])
+        )
+        self.assertEqual(
+            [item["name"] for item in response.json()["items"]], ["Bouéni"]
+        )
+
+    def test_other_levels(self) -> None:
+        self.assertEqual(
+            client.get("/departements?flat=true").json()["items"][0]["region_insee"],
+            "06",
+        )
+        self.assertEqual(
+            set(client.get("/regions?fields=name").json()["items"][0]),
+            {"id", "name"},
+        )
+        self.assertEqual(
+            set(client.get("/epcis?flat=true").json()["items"][0]),
+            {"id", "name", "siren"},
+        )
+
+    def test_unknown_fields(self) -> None:
+        response = client.get("/communes?fields=name,years")
+        self.assertEqual(response.status_code, 400)
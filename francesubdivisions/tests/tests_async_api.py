@@ -0,0 +1,141 @@
+import gzip
+import json
+
+from django.core.cache import cache
+from django.test import TestCase
+from ninja.testing import TestAsyncClient
+
+from francesubdivisions.async_api import router
+from francesubdivisions.models import Commune, DataYear, Departement, Epci, Region
+from francesubdivisions.services.autocomplete import clear_search_indexes
+from francesubdivisions.services.fragments import clear_fragments
+
+client = TestAsyncClient(router)
+
+
+class AsyncEndpointsTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        clear_search_indexes()
+        self.addCleanup(clear_search_indexes)
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+
+        year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(name="Mayotte", insee="06", siren="237500079")
+        region.years.add(year)
+        dept = Departement.objects.create(name="Mayotte", insee="976", region=region)
+        dept.years.add(year)
+        for insee, siren, name, population in [
+            ("97601", "297601007", "Acoua", 5000),
+            ("97602", "297602005", "Bandraboua", 10000),
+        ]:
+            commune = Commune.objects.create(
+                name=name,
+                insee=insee,
+                siren=siren,
+                departement=dept,
+                population=population,
+            )
+            commune.years.add(year)
+
+    async def test_communes_are_listed(self) -> None:
+        response = await client.get("/communes?page_size=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["items"][0]["insee"], "97601")
+
+        response = await client.get(
+            f"/communes?page_size=1&cursor={response.json()['next_cursor']}"
+        )
+        self.assertEqual(response.json()["items"][0]["insee"], "97602")
+        self.assertIsNone(response.json()["next_cursor"])
+
+    async def test_commune_is_retrieved_by_insee_or_siren(self) -> None:
+        response = await client.get("/communes/97601")
+        self.assertEqual(response.json()["name"], "Acoua")
+        self.assertEqual(response.json()["departement"]["insee"], "976")
+
+        response = await client.get("/communes/297602005")
+        self.assertEqual(response.json()["name"], "Bandraboua")
+
+        response = await client.get("/communes/976")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_missing_fragments_are_built_before_serialization(self) -> None:
+        await client.get("/communes/97601")
+        # Bulk imports don't change the data version, nor the built Fragments
+        await Epci.objects.abulk_create(
+            [Epci(name="CC du Sud", siren="200060473", slug="cc-du-sud")]
+        )
+        epci = await Epci.objects.aget(siren="200060473")
+        await Commune.objects.filter(insee="97601").aupdate(epci=epci)
+
+        response = await client.get("/communes/insee/97601")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["epci"]["siren"], "200060473")
+        self.assertEqual(response.json()["departement"]["insee"], "976")
+
+        response = await client.get("/communes")
+        self.assertEqual(response.json()["items"][0]["epci"]["name"], "CC du Sud")
+
+    async def test_unknown_region_is_not_found(self) -> None:
+        response = await client.get("/regions/220100010")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_not_modified(self) -> None:
+        response = await client.get("/regions/237500079")
+        self.assertEqual(response.status_code, 200)
+
+        response = await client.get(
+            "/regions/237500079", META={"HTTP_IF_NONE_MATCH": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_search(self) -> None:
+        for enabled in [True, False]:
+            with self.settings(FRANCESUBDIVISIONS_SEARCH_INDEX=enabled):
+                await cache.aclear()
+                response = await client.get(
+                    "/subdivisions/ba?year=2021&category=communes"
+                )
+                self.assertEqual(response.json(), [])
+
+                response = await client.get("/subdivisions/band?year=2021")
+                self.assertEqual(
+                    [item["name"] for item in response.json()[0]["items"]],
+                    ["Bandraboua"],
+                )
+
+    async def test_export(self) -> None:
+        response = await client.get("/export/communes.ndjson?departement=976")
+        self.assertTrue(response.streaming)
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["name"], "Acoua")
+
+    async def test_hierarchy(self) -> None:
+        response = await client.get(
+            "/hierarchy?year=2021", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(response["ETag"].startswith("W/"))
+        hierarchy = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(hierarchy["regions"][0]["departements"][0]["communes"]), 2)
+
+    async def test_data(self) -> None:
+        response = await client.get(
+            "/data/departements?codes=976&datacodes=population&years=2021"
+        )
+        self.assertEqual(response.json()["values"], [[[None]]])
+
+    async def test_flat_communes(self) -> None:
+        response = await client.get("/communes?fields=insee,departement_insee")
+        self.assertEqual(
+            response.json()["items"][0],
+            {
+                "id": response.json()["items"][0]["id"],
+                "insee": "97601",
+                "departement_insee": "976",
+            },
+        )
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from django.test import TestCase
 from django.db import IntegrityError
 from django.core.exceptions import ValidationError
@@ -15,6 +16,7 @@ from francesubdivisions.models import (
     Region,
     RegionData,
 )
+from francesubdivisions.services.years import clear_current_years
 
 
 class MetadataTestCase(TestCase):
@@ -64,6 +66,25 @@ class DataSourceTestCase(TestCase):
             )
 
 
+class DataSourceFingerprintTestCase(TestCase):
+    def setUp(self) -> None:
+        year = DataYear.objects.create(year=2020)
+        self.source = DataSource.objects.create(
+            title="Test title", url="http://test-url.com", year=year
+        )
+
+    def test_new_source_is_not_unchanged(self) -> None:
+        self.assertFalse(self.source.is_unchanged(""))
+
+    def test_imported_source_is_unchanged(self) -> None:
+        self.source.record_import("abc", 12, timedelta(seconds=3))
+
+        test_item = DataSource.objects.get(id=self.source.id)
+        self.assertEqual(test_item.row_count, 12)
+        self.assertTrue(test_item.is_unchanged("abc"))
+        self.assertFalse(test_item.is_unchanged("def"))
+
+
 class RegionTestCase(TestCase):
     def setUp(self) -> None:
         test_item = Region.objects.create(insee=11, name="Test region")
@@ -305,6 +326,15 @@ class CommuneTestCase(TestCase):
             test_item.siren = "42"
             test_item.save()
 
+    def test_commune_has_search_name(self) -> None:
+        test_item = Commune.objects.get(insee="01001")
+        test_item.name = "L’Île-Saint-Étienne"
+        test_item.save()
+        self.assertEqual(test_item.search_name, "l'ile-saint-etienne")
+        self.assertEqual(
+            Commune.objects.filter(search_name__startswith="l'ile-s").count(), 1
+        )
+
 
 class RegionDataTestCase(TestCase):
     def setUp(self) -> None:
@@ -344,6 +374,15 @@ class RegionDataTestCase(TestCase):
                 source=source,
             )
 
+    def test_region_data_defaults_to_current_year(self) -> None:
+        clear_current_years()
+        self.addCleanup(clear_current_years)
+        Metadata.objects.create(prop="cog_regions_year", value="2020")
+
+        region = Region.objects.get(insee="11")
+        test_item = region.get_data(datacode="property").get()
+        self.assertEqual(test_item.value, "Test data item")
+
 
 class DepartementDataTestCase(TestCase):
     def setUp(self) -> None:
@@ -367,6 +406,11 @@ class DepartementDataTestCase(TestCase):
         )
         self.assertEqual(test_item.value, "Test data item")
 
+    def test_departement_data_is_read_from_its_model(self) -> None:
+        dept = Departement.objects.get(insee="11")
+        test_item = dept.get_data(year=2020, datacode="property").get()
+        self.assertEqual(test_item.value, "Test data item")
+
     def test_departement_data_is_unique_per_year(self) -> None:
         dept = Departement.objects.get(insee="11")
         year = DataYear.objects.get(year=2020)
@@ -463,3 +507,32 @@ class DepartementDataTestCase(TestCase):
                 value="Test data duplicate",
                 source=source,
             )
+
+
+class CollectivityDataUpsertTestCase(TestCase):
+    def setUp(self) -> None:
+        self.year = DataYear.objects.create(year=2021)
+        self.source = DataSource.objects.create(
+            title="Test title", url="http://test-url.com", year=self.year
+        )
+        self.region = Region.objects.create(insee="53", name="Bretagne")
+
+    def test_data_points_are_inserted(self) -> None:
+        region_id, year_id, source_id = self.region.id, self.year.id, self.source.id
+        count = RegionData.objects.upsert(
+            [
+                (region_id, year_id, "tncc", "0", "string", source_id),
+                (region_id, year_id, "nccenr", "Bretagne", "string", source_id),
+            ]
+        )
+        self.assertEqual(count, 2)
+        self.assertEqual(RegionData.objects.filter(region=self.region).count(), 2)
+
+    def test_changed_value_is_updated_in_place(self) -> None:
+        row = (self.region.id, self.year.id, "tncc", "0", "string", self.source.id)
+        RegionData.objects.upsert([row])
+        RegionData.objects.upsert([row[:3] + ("1",) + row[4:]])
+
+        test_item = RegionData.objects.get(region=self.region, datacode="tncc")
+        self.assertEqual(test_item.value, "1")
+        self.assertEqual(RegionData.objects.count(), 1)
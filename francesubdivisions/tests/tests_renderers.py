@@ -0,0 +1,75 @@
+import json
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils.translation import gettext_lazy
+from ninja import NinjaAPI
+from ninja.testing import TestClient
+
+from francesubdivisions.api import router
+from francesubdivisions.models import Commune, DataYear, Departement, Epci, Region
+from francesubdivisions.renderers import ORJSONRenderer, dumps, orjson
+from francesubdivisions.services.fragments import Fragment, clear_fragments
+
+client = TestClient(router)
+
+
+@skipUnless(orjson, "orjson is not installed")
+class DumpsTestCase(TestCase):
+    def test_fragments_are_spliced(self) -> None:
+        fragment = Fragment({"id": 2, "name": "Mayotte"})
+        content = dumps({"items": [{"id": 1, "departement": fragment}] * 2})
+        self.assertEqual(
+            content,
+            b'{"items":[{"id":1,"departement":{"id":2,"name":"Mayotte"}},'
+            b'{"id":1,"departement":{"id":2,"name":"Mayotte"}}]}',
+        )
+
+    def test_other_types(self) -> None:
+        self.assertEqual(
+            json.loads(dumps({"name": gettext_lazy("Mayotte"), "population": None})),
+            {"name": "Mayotte", "population": None},
+        )
+
+
+@skipUnless(orjson, "orjson is not installed")
+class ORJSONRendererTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        api = NinjaAPI(
+            renderer=ORJSONRenderer(), urls_namespace="orjson-renderer-tests"
+        )
+        api.add_router("/", router)
+        cls.orjson_client = TestClient(api)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.addCleanup(cache.clear)
+        clear_fragments()
+        self.addCleanup(clear_fragments)
+
+        year = DataYear.objects.create(year=2021)
+        region = Region.objects.create(name="Mayotte", insee="06", siren="237500079")
+        region.years.add(year)
+        dept = Departement.objects.create(name="Mayotte", insee="976", region=region)
+        dept.years.add(year)
+        epci = Epci.objects.create(name="CC du Sud", siren="200060473")
+        for insee, name in [("97601", "Acoua"), ("97602", "Bandraboua")]:
+            commune = Commune.objects.create(
+                name=name, insee=insee, departement=dept, epci=epci
+            )
+            commune.years.add(year)
+
+    def test_responses_match_the_default_renderer(self) -> None:
+        for path in ["/communes", "/communes/97601", "/departements", "/regions"]:
+            expected = client.get(path).json()
+            cache.clear()
+            with self.settings(FRANCESUBDIVISIONS_JSON_FRAGMENTS=True):
+                response = self.orjson_client.get(path)
+            cache.clear()
+            self.assertEqual(
+                response["Content-Type"], "application/json; charset=utf-8"
+            )
+            self.assertEqual(response.json(), expected)